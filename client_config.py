@@ -39,6 +39,11 @@ class ClientConfig:
     file_seg_duration = 25
     file_seg_overlap = 2
 
+    binary_audio = True  # send PCM as binary websocket frames instead of base64 in JSON
+    delta_results = True  # receive only newly appended tokens in each result message
+    partial_results = False  # receive non-final results while a long recording is still being recognized
+    result_fields = ['text', 'time_start', 'time_submit', 'time_complete']  # result fields the server should send, empty for all
+
     auto_startup = False
     show_notifications = True
     notify_on_result = False
@@ -0,0 +1,388 @@
+# coding: utf-8
+
+'''
+服务端性能基准测试，直接在本进程里加载模型，不经过 websocket
+
+用法：
+
+    python benchmark_server.py batch [--wav 测试.wav] [--seconds 5] [--rounds 20]
+    python benchmark_server.py segment [--wav 长音频.wav] [--ref 参考文本.txt]
+    python benchmark_server.py predecode [--wav 听写.wav]
+    python benchmark_server.py warmup [--wav 听写.wav] [--idle 60] [--keep-warm 10]
+    python benchmark_server.py tune [--goal rtf|p95] [--max-workers 4] [--dry-run]
+
+不提供 wav 时使用合成音频（16000 采样率、单声道）。
+'''
+
+import os
+import sys
+import time
+import wave
+import argparse
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(__file__); os.chdir(BASE_DIR)
+sys.path.insert(0, BASE_DIR)
+
+from config import ServerConfig as Config
+from config import ParaformerArgs
+
+
+def load_audio(path: str, seconds: float) -> np.ndarray:
+    '''读取 16000 采样率、16bit 的 wav，没有路径时生成合成音频'''
+    if not path:
+        # 合成音频：长短不一的「音节」，音节间有短间隙，偶尔有较长的停顿，叠加底噪
+        rng = np.random.default_rng(0)
+        parts, length = [], 0
+        while length < 16000 * seconds:
+            t = np.arange(int(16000 * rng.uniform(0.15, 0.35))) / 16000
+            parts.append(0.1 * np.sin(2 * np.pi * rng.uniform(120, 300) * t) * np.hanning(len(t)))
+            gap = rng.uniform(0.3, 0.8) if rng.random() < 0.15 else rng.uniform(0.02, 0.08)
+            parts.append(np.zeros(int(16000 * gap)))
+            length += len(parts[-1]) + len(parts[-2])
+        samples = np.concatenate(parts)[:int(16000 * seconds)]
+        return (samples + 0.002 * rng.standard_normal(len(samples))).astype(np.float32)
+    with wave.open(path, 'rb') as f:
+        if f.getframerate() != 16000 or f.getsampwidth() != 2:
+            sys.exit('需要 16000 采样率、16bit 的 wav 文件')
+        data = np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16)
+        data = data.reshape(-1, f.getnchannels()).mean(axis=1)
+    return (data / 32768).astype(np.float32)
+
+
+def load_recognizer():
+    import sherpa_onnx
+    return sherpa_onnx.OfflineRecognizer.from_paraformer(
+        **{key: value for key, value in ParaformerArgs.__dict__.items() if not key.startswith('_')}
+    )
+
+
+def percentile(values, q):
+    return float(np.percentile(np.asarray(values), q)) if values else 0.0
+
+
+def decode(recognizer, samples_list, batched: bool):
+    streams = []
+    for samples in samples_list:
+        stream = recognizer.create_stream()
+        stream.accept_waveform(16000, samples)
+        streams.append(stream)
+    if batched and len(streams) > 1:
+        recognizer.decode_streams(streams)
+    else:
+        for stream in streams:
+            recognizer.decode_stream(stream)
+
+
+def bench_batch(args):
+    '''
+    模拟 N 个客户端同时提交片段，对比逐个识别与批量识别（每批最多 batch_max_size 个）
+    的吞吐量（实时率的倒数）和 p99 延迟
+    '''
+    recognizer = load_recognizer()
+    samples = load_audio(args.wav, args.seconds)
+    duration = len(samples) / 16000
+    decode(recognizer, [samples], False)       # 预热
+
+    print(f'片段时长 {duration:.2f}s，每批最多 {Config.batch_max_size} 个，重复 {args.rounds} 轮\n')
+    print(f'{"并发":>4}  {"模式":<6}{"吞吐(音频秒/秒)":>16}{"p50(ms)":>10}{"p99(ms)":>10}')
+    for concurrency in (1, 4, 16):
+        for batched in (False, True):
+            latencies = []
+            t_total = 0
+            for _ in range(args.rounds):
+                t0 = time.perf_counter()
+                if batched:
+                    for i in range(0, concurrency, Config.batch_max_size):
+                        group = min(Config.batch_max_size, concurrency - i)
+                        decode(recognizer, [samples] * group, True)
+                        latencies += [time.perf_counter() - t0] * group
+                else:
+                    for _ in range(concurrency):
+                        decode(recognizer, [samples], False)
+                        latencies.append(time.perf_counter() - t0)
+                t_total += time.perf_counter() - t0
+            throughput = duration * concurrency * args.rounds / t_total
+            print(f'{concurrency:>4}  {"批量" if batched else "逐个":<6}{throughput:>16.1f}'
+                  f'{percentile(latencies, 50) * 1000:>10.0f}{percentile(latencies, 99) * 1000:>10.0f}')
+
+
+def split(samples: np.ndarray, seg_duration, seg_overlap, silence: bool, phrase: float = 0):
+    '''按服务端接收时的方式把整段音频切成 Task 列表（每次写入 50ms）'''
+    from util.server_audio_buffer import AudioBuffer
+    from util.server_segmenter import plan_cut, FrameEnergy
+    from util.server_classes import Task
+
+    buffer = AudioBuffer(4 * 16000 * (seg_duration + seg_overlap * 2))
+    energy = FrameEnergy()
+    tasks, offset, overlap = [], 0, 0
+    data = memoryview(samples.tobytes())
+    for i in range(0, len(data), 3200):
+        view = data[i:i + 3200]
+        while True:
+            view = view[buffer.write(view):]
+            cut = plan_cut(buffer.peek(), seg_duration, seg_overlap,
+                           silence, Config.seg_silence_ratio, phrase, energy)
+            if cut is None:
+                break
+            size, step, seg_overlap_ = cut
+            tasks.append(Task('file', bytes(buffer.peek(size)), offset, seg_overlap_,
+                              'bench', 'bench', False, 0, 0, head_overlap=overlap))
+            buffer.consume(step)
+            energy.consume(step // 4)
+            offset += step / 4 / 16000
+            overlap = seg_overlap_
+    tasks.append(Task('file', bytes(buffer.peek()), offset, 0,
+                      'bench', 'bench', True, 0, 0, head_overlap=overlap))
+    return tasks
+
+
+def edit_distance(a: str, b: str) -> int:
+    row = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        prev, row[0] = row[0], i
+        for j, cb in enumerate(b, 1):
+            prev, row[j] = row[j], min(row[j] + 1, row[j - 1] + 1, prev + (ca != cb))
+    return row[-1]
+
+
+def bench_segment(args):
+    '''
+    对比固定时长加重叠的切分与在停顿处切分：
+    总识别耗时、实际送去识别的音频时长、切在说话中的切点数，以及与参考文本的字差异
+    '''
+    from util.server_recognize import recognize
+    from util.server_segmenter import frame_energy, FRAME
+
+    recognizer = load_recognizer()
+    samples = load_audio(args.wav, args.seconds)
+    duration = len(samples) / 16000
+    energy = frame_energy(samples)
+    speaking = np.percentile(energy, 90) * Config.seg_silence_ratio
+
+    reference = ''
+    if args.ref:
+        with open(args.ref, encoding='utf-8') as f:
+            reference = f.read().strip()
+    elif duration <= 120:
+        from util.server_classes import Task
+        reference = recognize(recognizer, Task('file', samples.tobytes(), 0, 0,
+                                               'reference', 'bench', True, 0, 0)).text
+
+    print(f'音频时长 {duration:.1f}s，分段 {args.duration}s，重叠 {args.overlap}s\n')
+    print(f'{"模式":<6}{"片段数":>6}{"识别音频(s)":>12}{"识别耗时(s)":>12}{"切在说话中":>10}{"字差异":>8}')
+    for silence in (False, True):
+        tasks = split(samples, args.duration, args.overlap, silence)
+        decoded = sum(len(task.data) for task in tasks) / 4 / 16000
+
+        # 切点附近 ±100ms 的能量高于停顿阈值，视为切在说话中
+        bad_cuts = 0
+        for task in tasks[1:]:
+            i = int(task.offset * 16000) // FRAME
+            if energy[max(0, i - 5):i + 5].mean() > speaking:
+                bad_cuts += 1
+
+        t0 = time.perf_counter()
+        text = ''.join(recognize(recognizer, task).text for task in tasks)      # 每条结果只带新增的文字
+        elapsed = time.perf_counter() - t0
+
+        diff = edit_distance(text, reference) if reference else '-'
+        print(f'{"停顿" if silence else "固定":<6}{len(tasks):>6}{decoded:>12.1f}{elapsed:>12.2f}{bad_cuts:>10}{diff:>8}')
+
+
+def bench_predecode(args):
+    '''
+    模拟不同时长的听写：开启边说边识别时，松开按键前的片段已在录音过程中识别完，
+    松开按键到出结果只需识别最后一段。对比两种方式下松开按键后的识别耗时
+    '''
+    from util.server_recognize import recognize
+
+    recognizer = load_recognizer()
+    audio = load_audio(args.wav, max(args.lengths))
+    decode(recognizer, [audio[:16000]], False)       # 预热
+
+    print(f'{"听写时长(s)":>10}{"整段识别(ms)":>14}{"边说边识别(ms)":>16}{"最后一段(s)":>12}')
+    for seconds in args.lengths:
+        samples = audio[:int(16000 * seconds)]
+        latencies = []
+        for phrase in (0, Config.predecode_min):
+            tasks = split(samples, 15, 2, Config.seg_silence, phrase)
+            for task in tasks[:-1]:
+                recognize(recognizer, task)
+            t0 = time.perf_counter()
+            recognize(recognizer, tasks[-1])
+            latencies.append(time.perf_counter() - t0)
+        tail = len(tasks[-1].data) / 4 / 16000
+        print(f'{seconds:>10.0f}{latencies[0] * 1000:>14.0f}{latencies[1] * 1000:>16.0f}{tail:>12.1f}')
+
+
+def bench_warmup(args):
+    '''
+    对比三种时刻的单次识别耗时：刚加载完的第一个请求、连续请求的稳定状态、空闲一段时间后的第一个请求；
+    分别在不预热、预热（加载后先识别一次合成音频）、预热并在空闲时保温三种做法下测量
+    '''
+    from util.server_recognize import warmup
+    from util.empty_working_set import empty_current_working_set
+    from platform import system
+
+    samples = load_audio(args.wav, args.seconds)
+
+    def once(recognizer):
+        t0 = time.perf_counter()
+        decode(recognizer, [samples], False)
+        return (time.perf_counter() - t0) * 1000
+
+    def idle(recognizer, keep_warm):
+        deadline = time.monotonic() + args.idle
+        while time.monotonic() < deadline:
+            time.sleep(min(keep_warm or args.idle, max(0, deadline - time.monotonic())))
+            if keep_warm:
+                warmup(recognizer, None, seconds=0.5)
+        if system() == 'Windows':
+            empty_current_working_set()     # 与服务端一样，空闲时内存可能被系统换出
+
+    print(f'片段时长 {args.seconds:.1f}s，空闲 {args.idle:.0f}s\n')
+    print(f'{"做法":<10}{"第一个请求(ms)":>14}{"稳定状态(ms)":>14}{"空闲之后(ms)":>14}')
+    for name, warm, keep_warm in (('不预热', False, 0), ('预热', True, 0), ('预热+保温', True, args.keep_warm)):
+        recognizer = load_recognizer()
+        if warm:
+            warmup(recognizer, None)
+        first = once(recognizer)
+        steady = percentile([once(recognizer) for _ in range(args.rounds)], 50)
+        idle(recognizer, keep_warm)
+        after = once(recognizer)
+        print(f'{name:<10}{first:>14.0f}{steady:>14.0f}{after:>14.0f}')
+
+
+def _tune_worker(num_threads, cpus, samples, jobs, latencies, ready, start):
+    '''tune 的识别进程：按给定线程数加载模型、绑定 CPU，预热后不断从 jobs 取片段识别'''
+    if cpus:
+        os.sched_setaffinity(0, cpus)
+    ParaformerArgs.num_threads = num_threads
+    recognizer = load_recognizer()
+    decode(recognizer, [samples], False)       # 预热
+    ready.put(None)
+    start.wait()
+    while jobs.get() is not None:
+        t0 = time.perf_counter()
+        decode(recognizer, [samples], False)
+        latencies.put(time.perf_counter() - t0)
+
+
+def tune_once(samples, workers, threads, affinity, segments):
+    '''一次性提交 segments 个片段，由 workers 个识别进程分担，返回 (实时率, p95 延迟秒数)'''
+    import multiprocessing
+    from util.server_affinity import plan_layout
+
+    jobs, latencies, ready = multiprocessing.Queue(), multiprocessing.Queue(), multiprocessing.Queue()
+    start = multiprocessing.Event()
+    # 与服务端相同的划分：绑定时为后处理留出 CPU，线程数以 threads 为上限
+    post = Config.punc_threads if Config.format_punc else 0
+    layouts = plan_layout(workers, threads, post, affinity)
+    processes = [multiprocessing.Process(target=_tune_worker,
+                                         args=(layout.decode_threads, layout.decode_cpus,
+                                               samples, jobs, latencies, ready, start))
+                 for layout in layouts]
+    for process in processes:
+        process.start()
+    for _ in processes:
+        ready.get()
+    for _ in range(segments):
+        jobs.put(1)
+    for _ in processes:
+        jobs.put(None)
+
+    t0 = time.perf_counter()
+    start.set()
+    values = [latencies.get() for _ in range(segments)]
+    elapsed = time.perf_counter() - t0
+    for process in processes:
+        process.join()
+    return elapsed / (segments * len(samples) / 16000), percentile(values, 95)
+
+
+def bench_tune(args):
+    '''
+    在本机测量识别进程数、每个进程的推理线程数、是否绑定 CPU 的各种组合，
+    按 --goal 选出实时率（RTF，越小吞吐越高）或 p95 延迟最好的一组，写入 tuned.json 供服务端启动时读取
+    '''
+    from util.server_affinity import available_cpus
+    from util.server_tuning import save_tuning, TUNED_FILE
+
+    samples = load_audio(args.wav, args.seconds)
+    cores = len(available_cpus())
+    powers = [n for n in (1, 2, 4, 8, 16, 32, 64) if n <= cores]
+    affinities = (False, True) if hasattr(os, 'sched_setaffinity') else (False,)
+    combos = [(w, t, a) for w in powers if w <= args.max_workers
+              for t in powers if w * t <= cores
+              for a in affinities]
+
+    print(f'可用 CPU {cores} 个，片段时长 {len(samples) / 16000:.1f}s，优化目标 {args.goal}\n')
+    print(f'{"进程数":>6}{"线程数":>6}{"绑定CPU":>8}{"RTF":>8}{"p95(ms)":>10}')
+    measured = []
+    for workers, threads, affinity in combos:
+        segments = max(args.segments, workers * 4)
+        rtf, p95 = tune_once(samples, workers, threads, affinity, segments)
+        measured.append({'num_workers': workers, 'num_threads': threads, 'cpu_affinity': affinity,
+                         'rtf': round(rtf, 4), 'p95_ms': round(p95 * 1000, 1)})
+        print(f'{workers:>6}{threads:>6}{"是" if affinity else "否":>8}{rtf:>8.3f}{p95 * 1000:>10.0f}')
+
+    best = min(measured, key=lambda m: m['rtf'] if args.goal == 'rtf' else m['p95_ms'])
+    print(f'\n最佳：{best["num_workers"]} 个进程，每个 {best["num_threads"]} 个线程，'
+          f'{"" if best["cpu_affinity"] else "不"}绑定 CPU，RTF {best["rtf"]}，p95 {best["p95_ms"]}ms')
+    if args.dry_run:
+        return
+    save_tuning({'goal': args.goal,
+                 'server': {'num_workers': best['num_workers'], 'cpu_affinity': best['cpu_affinity']},
+                 'paraformer': {'num_threads': best['num_threads']},
+                 'measured': measured})
+    print(f'已写入 {TUNED_FILE}，重启服务端后生效')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='EchoType 服务端基准测试')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('batch', help='并发 1/4/16 路时，逐个识别与批量识别的对比')
+    p.add_argument('--wav', default='', help='16000 采样率的 wav 文件，不提供则使用合成音频')
+    p.add_argument('--seconds', type=float, default=5, help='合成音频的时长')
+    p.add_argument('--rounds', type=int, default=20)
+    p.set_defaults(func=bench_batch)
+
+    p = sub.add_parser('segment', help='固定时长切分与停顿处切分的对比')
+    p.add_argument('--wav', default='', help='16000 采样率的 wav 文件，不提供则使用合成音频')
+    p.add_argument('--ref', default='', help='参考文本，不提供时对 2 分钟以内的音频整段识别作为参考')
+    p.add_argument('--seconds', type=float, default=90, help='合成音频的时长')
+    p.add_argument('--duration', type=float, default=15, help='分段长度')
+    p.add_argument('--overlap', type=float, default=2, help='分段重叠')
+    p.set_defaults(func=bench_segment)
+
+    p = sub.add_parser('predecode', help='不同听写时长下，松开按键到出结果的识别耗时')
+    p.add_argument('--wav', default='', help='16000 采样率的 wav 文件，不提供则使用合成音频')
+    p.add_argument('--lengths', type=float, nargs='+', default=[3, 6, 12, 18, 30])
+    p.set_defaults(func=bench_predecode)
+
+    p = sub.add_parser('warmup', help='预热与空闲保温对第一个请求、空闲后请求耗时的影响')
+    p.add_argument('--wav', default='', help='16000 采样率的 wav 文件，不提供则使用合成音频')
+    p.add_argument('--seconds', type=float, default=5, help='合成音频的时长')
+    p.add_argument('--rounds', type=int, default=10, help='测量稳定状态时连续识别的次数')
+    p.add_argument('--idle', type=float, default=60, help='空闲多少秒后再识别')
+    p.add_argument('--keep-warm', type=float, default=10, help='保温时每隔多少秒做一次很短的识别')
+    p.set_defaults(func=bench_warmup)
+
+    p = sub.add_parser('tune', help='测出本机最佳的识别进程数、线程数与 CPU 绑定，写入 tuned.json')
+    p.add_argument('--wav', default='', help='16000 采样率的 wav 文件，不提供则使用合成音频')
+    p.add_argument('--seconds', type=float, default=10, help='合成音频的时长')
+    p.add_argument('--goal', choices=('rtf', 'p95'), default='rtf', help='优化吞吐（实时率）还是 p95 延迟')
+    p.add_argument('--max-workers', type=int, default=4, help='最多尝试多少个识别进程')
+    p.add_argument('--segments', type=int, default=16, help='每种组合识别的片段数')
+    p.add_argument('--dry-run', action='store_true', help='只测量，不写入 tuned.json')
+    p.set_defaults(func=bench_tune)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -10,6 +10,33 @@ class ServerConfig:
     format_num = True  # 输出时是否将中文数字转为阿拉伯数字
     format_punc = True  # 输出时是否启用标点符号引擎
     format_spell = True  # 输出时是否调整中英之间的空格
+    punc_chunk = 200     # 长文本未加标点的文字超过多少字时，先给其中已说完的句子加标点
+    punc_context = 20    # 句末标点之后至少还有多少字，才认为这句话已经完整
+    onnx_cache = True    # 缓存标点模型经 onnxruntime 优化后的计算图，加快之后的启动
+
+    seg_silence = True      # 优先在停顿处切分片段（片段间不重叠），找不到停顿时按固定时长加重叠切分
+    seg_silence_ratio = 0.1         # 能量低于说话音量的多少倍算作停顿
+    predecode = True        # 麦克风听写时，边说边识别已经说完的短句
+    predecode_min = 3       # 短句至少多少秒才提前识别
+
+    num_workers = 1         # 识别进程数，每个进程加载一份模型
+    warmup = True           # 加载模型后先用合成音频识别一次，免得第一个请求变慢
+    keep_warm = 0           # 空闲超过多少秒就做一次很短的识别，保持模型内存常驻，0 为关闭
+    prefork = False         # 只加载一次模型再 fork 出各识别进程，共享模型内存（仅 Linux，各进程单线程推理，num_workers 为 1 时不起作用）
+    cpu_affinity = False    # 把每个识别进程绑定到各自的一组 CPU 上（仅 Linux）
+    cpu_sets = []           # 手动指定每个识别进程的 CPU，如 [[0, 1, 2, 3], [4, 5, 6, 7]]，为空则自动划分
+    punc_threads = 4        # 标点模型的推理线程数；绑定 CPU 时，每组 CPU 的最后这么多个留给后处理
+    batch_max_size = 8      # 一次批量识别的最大片段数
+    batch_wait_ms = 10      # 收到第一个片段后，最多再等多少毫秒凑批
+    priority_file_max_wait = 5      # 文件片段多少秒没有得到识别时，提前识别一个（每个窗口最多一个）
+    result_ttl = 600        # 未完成任务超过多少秒没有新片段，就清除其识别结果
+    result_max_entries = 1000       # 每个识别进程最多保留多少个未完成任务的结果
+    metrics_interval = 5    # 识别进程上报运行指标的间隔秒数
+
+    max_connections = 1024  # 同时在线的最大连接数
+
+    shm_slots = 16          # 共享内存中的音频槽位数
+    shm_slot_seconds = 30   # 每个槽位可容纳的音频时长，超过的片段仍经队列传输
 
 
 # 客户端配置
@@ -47,6 +74,11 @@ class ClientConfig:
     file_seg_duration = 25           # 转录文件时分段长度
     file_seg_overlap = 2             # 转录文件时分段重叠
 
+    binary_audio = True             # 以二进制帧发送音频，False 则用旧的 base64 JSON 消息
+    delta_results = True            # 结果消息只接收新增的 tokens，False 则每次接收全文
+    partial_results = False         # 是否接收中间结果
+    result_fields = ['text', 'time_start', 'time_submit', 'time_complete']  # 需要服务端发送的结果字段，为空则全部
+
     auto_startup = False
     show_notifications = True
     notify_on_result = False
@@ -3,20 +3,27 @@ import sys
 import asyncio
 import json
 from pathlib import Path
-from multiprocessing import Process, Manager
+from multiprocessing import Process, Queue, RawValue, get_all_start_methods
 from platform import system
 
 import websockets
 from config import ServerConfig as Config
+from config import ParaformerArgs
 from util.server_cosmic import Cosmic, console
 from util.server_check_model import check_model
 from util.server_ws_recv import ws_recv
 from util.server_ws_send import ws_send
-from util.server_init_recognizer import init_recognizer
+from util.server_init_recognizer import init_recognizer, prefork_recognizers
+from util.server_shared_audio import SharedAudioPool
+from util.server_router import TaskRouter
+from util.server_registry import ConnectionRegistry
+from util.server_result_store import ResultStore
 from util.empty_working_set import empty_current_working_set
+from util.server_tuning import load_tuning
 
 BASE_DIR = os.path.dirname(__file__); os.chdir(BASE_DIR)    # 确保 os.getcwd() 位置正确，用相对路径加载模型
 PROGRESS_FILE = Path(__file__).with_name('progress.json')
+load_tuning()       # tune 命令测出的本机最佳配置，子进程导入本模块时也会读取
 
 
 def _reset_progress_file() -> None:
@@ -51,25 +58,59 @@ async def main():
     console.print(f'Current base directory: [cyan underline]{BASE_DIR}', end='\n\n')
     console.print(f'Bound service address: [cyan underline]{Config.addr}:{Config.port}', end='\n\n')
 
-    # Cross-process list to store socket IDs for recognition process to check connection status
-    Cosmic.sockets_id = Manager().list()
+    # Shared registry of live connections, recognition processes check it before decoding
+    Cosmic.registry = ConnectionRegistry(Config.max_connections)
 
-    # Recognition subprocess
+    # Full transcripts accumulated for connections that don't take deltas, bounded like the recognizer's results
+    Cosmic.transcripts = ResultStore(Config.result_ttl, Config.result_max_entries)
+
+    # Shared memory slots for passing audio segments to the recognition process
+    Cosmic.audio_pool = SharedAudioPool(Config.shm_slots, 4 * 16000 * Config.shm_slot_seconds)
+
+    # Recognition subprocesses, each with its own input queue
     _reset_progress_file()
-    recognize_process = Process(target=init_recognizer,
-                                args=(Cosmic.queue_in,
-                                      Cosmic.queue_out,
-                                      Cosmic.sockets_id),
-                                daemon=True)
-    recognize_process.start()
+    num_workers = max(1, Config.num_workers)
+    Cosmic.queues_in = [Queue() for _ in range(num_workers)]
+    loads = [RawValue('i', 0) for _ in range(num_workers)]
+    Cosmic.queue_in = TaskRouter(Cosmic.queues_in, loads)
+    if Config.prefork and num_workers == 1:
+        # 只有一个识别进程时没有内存可共享，prefork 只会让它单线程推理
+        console.print('[yellow]prefork ignored with num_workers = 1: nothing to share, and forked workers '
+                      f'decode on 1 thread instead of {ParaformerArgs.num_threads}')
+    if Config.prefork and num_workers > 1 and 'fork' in get_all_start_methods():
+        # Load models once, then fork the recognition processes so they share model memory
+        Cosmic.prefork = Process(target=prefork_recognizers,
+                                 args=(Cosmic.queues_in,
+                                       Cosmic.queue_out,
+                                       Cosmic.registry,
+                                       Cosmic.audio_pool,
+                                       loads))
+        Cosmic.prefork.start()
+    else:
+        for worker, queue_in in enumerate(Cosmic.queues_in):
+            recognize_process = Process(target=init_recognizer,
+                                        args=(queue_in,
+                                              Cosmic.queue_out,
+                                              Cosmic.registry,
+                                              Cosmic.audio_pool,
+                                              worker,
+                                              loads[worker]),
+                                        daemon=True)
+            recognize_process.start()
+    loaded = 0
     while True:
         flag = Cosmic.queue_out.get()
         if isinstance(flag, dict):
             stage = flag.get("stage")
             status = flag.get("status")
+            if stage == "loaded" and status == "done":
+                loaded += 1
+                if loaded < num_workers:
+                    continue
             if stage and status:
-                console.print(f"[cyan]Loading progress[/] -> {stage}: {status}")
-                _append_progress({'stage': stage, 'status': status})
+                seconds = f" ({flag['seconds']:.2f}s)" if 'seconds' in flag else ''
+                console.print(f"[cyan]Loading progress[/] -> {stage}: {status}{seconds}")
+                _append_progress(flag)
             if stage == "loaded" and status == "done":
                 break
             continue
@@ -104,6 +145,13 @@ def init():
         print(e)
     finally:
         Cosmic.queue_out.put(None)
+        if Cosmic.prefork:
+            Cosmic.prefork.terminate()
+        for shared in (Cosmic.audio_pool, Cosmic.registry):
+            try:
+                shared.close()
+            except Exception:
+                pass
         sys.exit(0)
         # os._exit(0)
      
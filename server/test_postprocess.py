@@ -0,0 +1,53 @@
+"""
+测试后处理线程：标点模型出错时，结果仍然返回，只是不加标点
+"""
+
+import os
+import sys
+import threading
+from queue import Queue
+
+# 服务端的 util 与客户端的同名，把 server 目录放在最前面
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config import ServerConfig as Config
+from util.server_classes import Result
+from util.server_postprocess import postprocess, StageStats
+
+
+def failing_punc_model(text):
+    raise RuntimeError('punc model failed')
+
+
+def run_postprocess(results, punc_model):
+    """把 results 依次交给后处理线程，返回从输出队列收到的结果"""
+    queue_post, queue_out = Queue(), Queue()
+    thread = threading.Thread(target=postprocess,
+                              args=(queue_post, queue_out, punc_model, StageStats()), daemon=True)
+    thread.start()
+    for result in results:
+        queue_post.put((result, 0))
+    queue_post.put(None)
+    thread.join(timeout=5)
+    assert not thread.is_alive()
+    return [queue_out.get(timeout=1) for _ in results]
+
+
+def make_result(text, is_final):
+    result = Result('task', 'socket', 'mic')
+    result.text = text
+    result.is_final = is_final
+    return result
+
+
+def test_failing_punc_model_still_returns_results():
+    format_punc, punc_chunk = Config.format_punc, Config.punc_chunk
+    Config.format_punc, Config.punc_chunk = True, 4
+    try:
+        outputs = run_postprocess([make_result('今天天气', False),
+                                   make_result('不错', True)], failing_punc_model)
+    finally:
+        Config.format_punc, Config.punc_chunk = format_punc, punc_chunk
+
+    assert [r.is_final for r in outputs] == [False, True]
+    assert outputs[1].text == '今天天气不错'
@@ -0,0 +1,154 @@
+"""
+识别进程与后处理线程的 CPU 绑定，以及 CPU 占用统计
+
+开启 cpu_affinity 后，每个识别进程分到一组 CPU：前一部分给声学模型的推理线程，
+后一部分给后处理线程（标点模型）。cpu_sets 可以手动指定每个进程的一组 CPU，
+为空时把可用的 CPU 平均分给各识别进程。各进程的 CPU 互不重叠，
+两个模型的 onnxruntime 线程数按分到的 CPU 数设置（不超过 num_threads、punc_threads），
+线程不会多于核数，也不会在核之间来回迁移。
+CPU 不够每个进程至少一个、或手动指定的各组无效（组数不够、有重叠、含不可用的 CPU）时，
+不绑定并打印警告，线程数限制在 核数 // 进程数 以内。
+核数不够两个模型的线程数时声学模型优先，后处理只留 1 个核。
+
+服务端和 benchmark_server.py tune 都用 plan_layout 划分，测出来的就是服务端实际的布局。
+
+Linux 上 sched_setaffinity(0) 只作用于调用它的线程，之后由它创建的线程继承绑定，
+所以在创建 onnxruntime 会话之前，由加载模型的线程先绑定自己。其它系统上不绑定。
+"""
+
+import os
+import time
+from pathlib import Path
+from typing import List, NamedTuple
+
+from config import ServerConfig as Config
+from config import ParaformerArgs
+from util.server_cosmic import console
+
+__all__ = ['available_cpus', 'WorkerLayout', 'plan_layout', 'worker_layout', 'pin_thread', 'CpuMeter']
+
+
+class WorkerLayout(NamedTuple):
+    """一个识别进程的 CPU 与线程数，CPU 列表为空表示不绑定"""
+    decode_cpus: List[int]
+    post_cpus: List[int]
+    decode_threads: int
+    post_threads: int
+
+
+def available_cpus() -> List[int]:
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def _counts(share: int, decode: int, post: int):
+    """share 个核分给声学模型和后处理各几个，各自不超过给定的线程数"""
+    if share >= decode + post:
+        return decode, post
+    # 不够时声学模型优先，后处理只留 1 个核（声学模型用不完的也给后处理），只有一个核时两者共用
+    post_n = min(post, max(1, share - decode)) if share > 1 else 0
+    return min(decode, share - post_n), post_n
+
+
+def _split(cpus: List[int], decode: int, post: int) -> WorkerLayout:
+    """把一个进程分到的 CPU 分给声学模型和后处理"""
+    decode_n, post_n = _counts(len(cpus), decode, post)
+    decode_cpus = cpus[:decode_n]
+    post_cpus = cpus[decode_n:decode_n + post_n] or decode_cpus
+    return WorkerLayout(decode_cpus, post_cpus, decode_n, min(post, len(post_cpus)) or 1)
+
+
+def _check_sets(sets: List[List[int]], num_workers: int, cpus: List[int]) -> str:
+    """cpu_sets 不能用的原因，能用时返回空字符串"""
+    if len(sets) < num_workers:
+        return f'{len(sets)} sets for {num_workers} workers'
+    blocks = [sorted(set(cpu_set)) for cpu_set in sets[:num_workers]]
+    if not all(blocks):
+        return 'empty set'
+    unknown = sorted({cpu for block in blocks for cpu in block} - set(cpus))
+    if unknown:
+        return f'CPUs {unknown} not available (available: {cpus})'
+    used = [cpu for block in blocks for cpu in block]
+    if len(used) != len(set(used)):
+        return 'sets overlap'
+    return ''
+
+
+def plan_layout(num_workers: int, decode: int, post: int, pin: bool, sets: List[List[int]] = (),
+                warn: bool = False) -> List[WorkerLayout]:
+    """
+    num_workers 个识别进程的布局，decode、post 是两个模型的线程数上限（post 为 0 表示不加标点）
+    pin 为真时各进程分到互不重叠的 CPU；sets 非空时按它划分
+    warn 为真时，绑定不了的原因通过 console 打印出来
+    """
+    num_workers = max(1, num_workers)
+    cpus = available_cpus()
+    if pin and hasattr(os, 'sched_setaffinity'):
+        if sets:
+            reason = _check_sets(sets, num_workers, cpus)
+            if not reason:
+                return [_split(sorted(set(cpu_set)), decode, post) for cpu_set in sets[:num_workers]]
+            problem = f'cpu_sets = {list(sets)} is invalid: {reason}'
+        else:
+            share = len(cpus) // num_workers
+            if share:
+                return [_split(cpus[i * share:(i + 1) * share], decode, post) for i in range(num_workers)]
+            problem = f'only {len(cpus)} CPUs for num_workers = {num_workers}'
+        if warn:
+            console.print(f'[yellow]cpu_affinity disabled, {problem}; workers will not be pinned')
+
+        # 分不开：不绑定，各进程的线程数加起来不超过核数
+        decode_n, post_n = _counts(max(1, len(cpus) // num_workers), decode, post)
+        return [WorkerLayout([], [], decode_n, max(1, post_n))] * num_workers
+
+    return [WorkerLayout([], [], decode, max(1, post))] * num_workers
+
+
+def worker_layout(worker: int, single_thread: bool = False, warn: bool = False) -> WorkerLayout:
+    """按配置计算第 worker 个识别进程的布局；single_thread 时两个模型都只用一个线程"""
+    decode = 1 if single_thread else ParaformerArgs.num_threads
+    post = (1 if single_thread else Config.punc_threads) if Config.format_punc else 0
+    return plan_layout(Config.num_workers, decode, post, Config.cpu_affinity, Config.cpu_sets, warn)[worker]
+
+
+def pin_thread(cpus: List[int]):
+    """把当前线程（及其之后创建的线程）绑定到 cpus 上，cpus 为空时不绑定"""
+    if cpus and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+
+
+class CpuMeter:
+    """
+    本进程在两次 report() 之间的 CPU 占用，percent 以一个核跑满为 100，
+    utilisation 是相对于分到的 CPU 数的占用率，接近 1 说明分到的核已经跑满
+    """
+
+    def __init__(self, cpus: List[int] = ()):
+        self.cpus = sorted(set(cpus))
+        self._wall = time.monotonic()
+        self._cpu = time.process_time()
+
+    def report(self) -> dict:
+        wall, cpu = time.monotonic(), time.process_time()
+        percent = (cpu - self._cpu) / max(wall - self._wall, 1e-6) * 100
+        self._wall, self._cpu = wall, cpu
+        cores = len(self.cpus) or os.cpu_count() or 1
+        return {'percent': round(percent, 1),
+                'utilisation': round(percent / 100 / cores, 3),
+                'cpus': self.cpus or 'all',
+                'migrations': _migrations()}
+
+
+def _migrations() -> int:
+    """本进程各线程被调度到其它 CPU 上的累计次数（仅 Linux），绑定后应基本不再增长"""
+    total = 0
+    for task in Path('/proc/self/task').glob('*'):
+        try:
+            for line in (task / 'sched').read_text().splitlines():
+                if line.startswith('se.nr_migrations'):
+                    total += int(line.split(':')[1])
+                    break
+        except (OSError, ValueError):
+            continue
+    return total
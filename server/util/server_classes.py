@@ -1,3 +1,6 @@
+import copy
+
+
 class Task:
     def __init__(self, source: str,
                  data,
@@ -7,17 +10,29 @@ class Task:
                  socket_id: str,
                  is_final: bool,
                  time_start: float,
-                 time_submit: float) -> None:
+                 time_submit: float,
+                 conn: tuple = None,
+                 head_overlap: float = None) -> None:
         self.source = source
         self.data = data
         self.offset = offset
-        self.overlap = overlap
+        self.overlap = overlap          # 与下一个片段重叠的秒数
+        self.head_overlap = overlap if head_overlap is None else head_overlap  # 与上一个片段重叠的秒数
         self.task_id = task_id
         self.socket_id = socket_id
         self.is_final = is_final
         self.time_start = time_start
         self.time_submit = time_submit
+        self.conn = conn        # 连接在 ConnectionRegistry 中的 (槽位, 代号)
         self.samplerate = 16000
+        self.slot = None        # 音频在共享内存中的槽位，为 None 时音频在 data 中
+        self.size = 0           # 槽位中音频的字节数
+
+
+class Cancel:
+    # 取消任务的通知，随片段一起送入识别进程的队列，清除该任务还在排队的片段
+    def __init__(self, task_id: str) -> None:
+        self.task_id = task_id
 
 
 class Result:
@@ -33,5 +48,30 @@ class Result:
 
         self.tokens = []                # 字级 token
         self.timestamps = []            # 字级 token 的时间戳
-        self.text = ''                  # 合并的文字
+        self.text = ''                  # 合并的文字；结果消息中是本次新增的文字，最终结果经后处理后是全文
+        self.text_parts = []            # 逐片段追加的文字，需要全文时才拼接
+        self.pending = []               # 末尾以 @@ 结尾的半个英文单词，等下一片段再拼成文字
         self.is_final = False           # 是否已完成所有片段识别
+
+        self.seq = 0                    # 消息序号，每发出一次结果加一
+        self.start = 0                  # 本条消息中第一个 token 在全部 token 中的位置
+        self.sent = 0                   # 已经发出的 token 数
+        self.text_sent = 0              # 已经发出的 text_parts 数
+
+    def snapshot(self) -> 'Result':
+        """
+        生成一条发往接收进程的结果消息，只带上次发出以来新增的 tokens 和 timestamps，
+        text 也只是新增的文字（最终结果的全文由后处理阶段格式化后填入），
+        传输量与新增内容成正比，而不是与全文成正比
+        """
+        message = copy.copy(self)
+        message.tokens = self.tokens[self.sent:]
+        message.timestamps = self.timestamps[self.sent:]
+        message.start = self.sent
+        message.text_parts, message.pending = [], []
+        message.text = ''.join(self.text_parts[self.text_sent:])
+        self.text_sent = len(self.text_parts)
+        self.seq += 1
+        message.seq = self.seq
+        self.sent = len(self.tokens)
+        return message
@@ -12,6 +12,12 @@ console = Console(highlight=False)
 
 class Cosmic:
     sockets: Dict[str, websockets.WebSocketClientProtocol] = {}
-    sockets_id: List
-    queue_in = Queue()
+    registry = None         # ConnectionRegistry，识别进程据此判断连接是否还在
+    subscriptions: Dict[str, dict] = {}     # 各连接在 subscribe 消息中协商的结果格式，以 socket id 为索引
+    transcripts = None      # ResultStore，旧格式连接的任务累积的 (socket_id, tokens, timestamps, texts)
+    metrics: Dict[str, dict] = {}   # 各识别进程定期上报的运行指标，以来源名为索引
+    audio_pool = None       # SharedAudioPool，接收进程与识别进程共享的音频槽位
+    queues_in: List[Queue] = []     # 每个识别进程一个输入队列
+    queue_in = None                 # TaskRouter，按 task_id 把片段分派到 queues_in
+    prefork = None                  # prefork 模式下加载模型、再 fork 出识别进程的进程
     queue_out = Queue()
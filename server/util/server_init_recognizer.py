@@ -1,73 +1,266 @@
+import os
+import sys
 import time
+import threading
+import multiprocessing
+from typing import List
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import sherpa_onnx
 from multiprocessing import Queue
+from queue import Empty
+from queue import Queue as ThreadQueue
 import signal
 from platform import system
 from config import ServerConfig as Config
 from config import ParaformerArgs, ModelPaths
 from util.server_cosmic import console
-from util.server_recognize import recognize
+from util.server_recognize import recognize_batch, discard, results, warmup
+from util.server_priority_queue import PriorityTaskQueue
+from util.server_postprocess import postprocess, StageStats
+from util.server_classes import Cancel
+from util.server_onnx_cache import cached_model_dir
+from util.server_memory import memory_usage
+from util.server_affinity import worker_layout, pin_thread, CpuMeter
 from util.empty_working_set import empty_current_working_set
 
 
 
-def disable_jieba_debug():
-    # Disable jieba debug logging
+def load_jieba():
+    # Disable jieba debug logging, and load its dictionary now instead of on first use
     import jieba
     import logging
     jieba.setLogLevel(logging.INFO)
+    jieba.initialize()
 
 
-def init_recognizer(queue_in: Queue, queue_out: Queue, sockets_id):
+def get_batch(queue_in: PriorityTaskQueue, max_size: int, wait: float):
+    """
+    阻塞等待第一个任务，然后最多再等 wait 秒，收集到 max_size 个任务为止
+    多个客户端同时松开按键时，它们的片段可以一起识别
+    一批只收同一类别的片段：一批的耗时取决于其中最长的片段，麦克风片段不能和很长的文件片段一起识别
+    """
+    tasks = [queue_in.get(timeout=1)]
+    kind = queue_in.last_class
+    deadline = time.monotonic() + wait
+    while len(tasks) < max_size:
+        remain = deadline - time.monotonic()
+        try:
+            tasks.append(queue_in.get(timeout=remain, kind=kind) if remain > 0 else queue_in.get_nowait(kind))
+        except Empty:
+            break
+    return tasks
 
-    # Ctrl-C 退出
-    signal.signal(signal.SIGINT, lambda signum, frame: exit())
+
+def load_models(queue_out: Queue, single_thread: bool = False, worker: int = 0):
+    """
+    加载语音模型和标点模型，返回 (recognizer, punc_model, 开始加载的时刻)
+    single_thread 为真时 onnxruntime 不创建线程池，加载后 fork 出的子进程才能正常推理
+    两个模型的线程数按第 worker 个识别进程的布局设置，开启 cpu_affinity 时推理线程绑定到分到的 CPU 上
+    """
+    layout = worker_layout(worker, single_thread, warn=worker == 0)     # 配置有问题时只提示一次
 
     # Import modules
+    t0 = time.time()
     with console.status("Loading modules...", spinner="bouncingBall", spinner_style="yellow"):
         import sherpa_onnx
         from funasr_onnx import CT_Transformer
-        disable_jieba_debug()
+    timings = {'modules': time.time() - t0}
     console.print('[green4]Modules loaded', end='\n\n')
-    queue_out.put({'stage': 'modules', 'status': 'done'})
-
-    # Load speech model
-    console.print('[yellow]Loading speech model', end='\r'); t1 = time.time()
-    recognizer = sherpa_onnx.OfflineRecognizer.from_paraformer(
-        **{key: value for key, value in ParaformerArgs.__dict__.items() if not key.startswith('_')}
-    )
-    console.print(f'[green4]Speech model loaded', end='\n\n')
-    queue_out.put({'stage': 'speech_model', 'status': 'done'})
-
-    # Load punctuation model
-    punc_model = None
+    queue_out.put({'stage': 'modules', 'status': 'done', 'seconds': round(timings['modules'], 2)})
+
+    def load_speech_model():
+        args = {key: value for key, value in ParaformerArgs.__dict__.items() if not key.startswith('_')}
+        args['num_threads'] = layout.decode_threads
+        if not single_thread:
+            pin_thread(layout.decode_cpus)
+        return sherpa_onnx.OfflineRecognizer.from_paraformer(**args)
+
+    def load_punc_model():
+        model_dir = ModelPaths.punc_model_dir
+        if Config.onnx_cache:
+            model_dir = cached_model_dir(model_dir)
+        if not single_thread:
+            pin_thread(layout.post_cpus)
+        return CT_Transformer(model_dir, quantize=True, intra_op_num_threads=layout.post_threads)
+
+    # 语音模型、标点模型、jieba 词典互不依赖，同时加载，各自计时
+    loaders = {'speech_model': load_speech_model, 'jieba': load_jieba}
     if Config.format_punc:
-        console.print('[yellow]Loading punctuation model', end='\r')
-        punc_model = CT_Transformer(ModelPaths.punc_model_dir, quantize=True)
-        console.print(f'[green4]Punctuation model loaded', end='\n\n')
-        queue_out.put({'stage': 'punc_model', 'status': 'done'})
+        loaders['punc_model'] = load_punc_model
     else:
         queue_out.put({'stage': 'punc_model', 'status': 'skipped'})
 
-    console.print(f'Model loading time: {time.time() - t1 :.2f}s', end='\n\n')
+    def timed(loader):
+        start = time.time()
+        return loader(), time.time() - start
+
+    models = {}
+    with console.status("Loading models...", spinner="bouncingBall", spinner_style="yellow"), \
+            ThreadPoolExecutor(len(loaders)) as pool:
+        futures = {pool.submit(timed, loader): stage for stage, loader in loaders.items()}
+        for future in as_completed(futures):
+            stage = futures[future]
+            models[stage], timings[stage] = future.result()
+            console.print(f'[green4]{stage} loaded: {timings[stage]:.2f}s')
+            queue_out.put({'stage': stage, 'status': 'done', 'seconds': round(timings[stage], 2)})
+    recognizer = models['speech_model']
+    punc_model = models.get('punc_model')
+
+    timings['total'] = time.time() - t0
+    console.print('Model loading time: ' + ', '.join(f'{k} {v:.2f}s' for k, v in timings.items()), end='\n\n')
+    return recognizer, punc_model, t0
+
+
+def warm_models(recognizer, punc_model, queue_out: Queue):
+    """预热：单个片段和整批片段各识别一次，再加一次标点"""
+    if not Config.warmup:
+        return
+    t0 = time.time()
+    warmup(recognizer, punc_model)
+    if Config.batch_max_size > 1:
+        warmup(recognizer, None, Config.batch_max_size)
+    queue_out.put({'stage': 'warmup', 'status': 'done', 'seconds': round(time.time() - t0, 2)})
+
+
+def serve(recognizer, punc_model, queue_in: Queue, queue_out: Queue, registry, audio_pool,
+          worker: int = 0, started: float = 0, single_thread: bool = False, load=None):
+    """识别进程的主循环：从 queue_in 取片段批量识别，结果交给后处理线程"""
+
+    # Ctrl-C 退出；prefork 模式下从父进程继承的 SIGTERM 处理恢复默认
+    signal.signal(signal.SIGINT, lambda signum, frame: exit())
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    # 识别循环所在的线程绑定到声学模型的 CPU 上，后处理线程绑定到后处理的 CPU 上
+    decode_cpus, post_cpus, _, _ = worker_layout(worker, single_thread)
+    pin_thread(decode_cpus)
+    cpu_meter = CpuMeter(decode_cpus + post_cpus)
 
     # 清空物理内存工作集
     if system() == 'Windows':
         empty_current_working_set()
 
-    queue_out.put({'stage': 'loaded', 'status': 'done'})
+    # 预热之后才宣告加载完成；prefork 模式下父进程在 fork 之前已经预热过
+    if not single_thread:
+        warm_models(recognizer, punc_model, queue_out)
+
+    queue_out.put({'stage': 'loaded', 'status': 'done', 'seconds': round(time.time() - started, 2)})
+
+    # 后处理线程：加标点、转数字、调空格，识别循环不等它完成
+    queue_post = ThreadQueue()
+    decode_stats, post_stats = StageStats(), StageStats()
+    threading.Thread(target=postprocess, args=(queue_post, queue_out, punc_model, post_stats, post_cpus),
+                     daemon=True).start()
+
+    # 丢弃任务已合并的结果，后处理线程中的格式化状态也一并清除
+    def drop(task_id):
+        discard(task_id)
+        queue_post.put(Cancel(task_id))
+
+    # 按优先级取任务：麦克风最终片段 > 麦克风中间片段 > 文件片段
+    # 被取消的任务：归还共享内存，丢弃已合并的结果
+    def on_cancel(task_id, tasks):
+        for task in tasks:
+            audio_pool.release(task)
+        drop(task_id)
+
+    tasks_in = PriorityTaskQueue(queue_in, Config.priority_file_max_wait, on_cancel, load)
+    metrics_time = time.time()
+    active_time = time.time()
 
     while True:
-        # 从队列中获取任务消息
+        # 定期上报各类任务的排队情况，以及识别、后处理两个阶段的耗时
+        if time.time() - metrics_time > Config.metrics_interval:
+            metrics_time = time.time()
+            queue_out.put({'type': 'metrics', 'source': f'recognizer-{worker}',
+                           'data': {'queue': tasks_in.metrics(),
+                                    'results': results.metrics(),
+                                    'decode': decode_stats.report(),
+                                    'postprocess': {**post_stats.report(), 'depth': queue_post.qsize()},
+                                    'memory': memory_usage(),
+                                    'cpu': cpu_meter.report()}})
+
+        # 从队列中获取任务消息，并在短时间内凑成一批
         # 阻塞最多1秒，便于中断退出
         try:
-            task = queue_in.get(timeout=1)       
-        except:
+            tasks = get_batch(tasks_in, Config.batch_max_size, Config.batch_wait_ms / 1000)
+        except Empty:
+            # 空闲太久，做一次很短的识别，免得模型内存被系统换出，下一个请求变慢
+            if Config.keep_warm and time.time() - active_time > Config.keep_warm:
+                warmup(recognizer, punc_model, seconds=0.5)
+                active_time = time.time()
             continue
+        active_time = time.time()
 
-        if task.socket_id not in sockets_id:    # Check if task's connection is still alive
+        batch = []
+        for task in tasks:
+            if not registry.alive(task.conn):       # Check if task's connection is still alive
+                audio_pool.release(task)
+                drop(task.task_id)
+                continue
+            batch.append(audio_pool.get(task))      # Map audio from shared memory
+        if not batch:
+            tasks_in.finish(len(tasks))
             continue
 
-        result = recognize(recognizer, punc_model, task)   # Perform recognition
-        queue_out.put(result)      # Return result
+        t0 = time.perf_counter()
+        try:
+            outputs = recognize_batch(recognizer, batch)   # Perform recognition
+        finally:
+            for task in batch:
+                audio_pool.release(task)
+            tasks_in.finish(len(tasks))
+        t1 = time.perf_counter()
+        decode_stats.add(t1 - t0, max(time.time() - task.time_submit for task in batch) - (t1 - t0))
+        for result in outputs:
+            queue_post.put((result, t1))      # Hand over to post-processing
+
+
+def init_recognizer(queue_in: Queue, queue_out: Queue, registry, audio_pool, worker: int = 0, load=None):
+
+    # Ctrl-C 退出
+    signal.signal(signal.SIGINT, lambda signum, frame: exit())
+
+    recognizer, punc_model, started = load_models(queue_out, worker=worker)
+    serve(recognizer, punc_model, queue_in, queue_out, registry, audio_pool, worker, started, load=load)
+
+
+def prefork_recognizers(queues_in: List[Queue], queue_out: Queue, registry, audio_pool, loads=None):
+    """
+    prefork 模式：在这个进程里只加载一次模型，再 fork 出各识别进程。
+    模型权重加载后只读，在 Linux 上各识别进程写时复制共享同一份物理内存，
+    多开识别进程几乎不增加内存，也不必每个进程都加载一遍。
+
+    fork 之后 onnxruntime 的线程池不可用，所以各识别进程的模型都是单线程推理，
+    并行靠多开识别进程（num_workers）。
+    """
+
+    # Ctrl-C 退出
+    signal.signal(signal.SIGINT, lambda signum, frame: sys.exit())
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit())
+
+    recognizer, punc_model, started = load_models(queue_out, single_thread=True)
+
+    # 在 fork 之前预热一次，推理时按需分配的内存也由各识别进程共享，不必每个进程各预热一遍
+    warm_models(recognizer, punc_model, queue_out)
+
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=serve,
+                               args=(recognizer, punc_model, queue_in, queue_out,
+                                     registry, audio_pool, worker, started, True,
+                                     loads[worker] if loads else None),
+                               daemon=True)
+               for worker, queue_in in enumerate(queues_in)]
+    for process in workers:
+        process.start()
+
+    # Ctrl-C 或主进程结束时，结束各识别进程后立即退出，不等待队列刷新，
+    # 以免被结束的识别进程留下的队列锁卡住退出
+    def stop(signum, frame):
+        for process in workers:
+            process.terminate()
+        os._exit(0)
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
 
+    for process in workers:
+        process.join()
@@ -0,0 +1,25 @@
+"""
+识别进程的内存占用
+
+Rss 是进程映射的全部物理内存，与其它进程共享的页也算在内；
+Pss 把共享页按共享的进程数均摊，各进程的 Pss 相加才是真实占用。
+prefork 模式下，各识别进程的 Rss 都包含整份模型，Pss 则只有其中一份的几分之一。
+"""
+
+from pathlib import Path
+
+__all__ = ['memory_usage']
+
+
+def memory_usage() -> dict:
+    """读取 /proc/self/smaps_rollup，返回以 MB 为单位的 rss、pss、shared；非 Linux 系统返回空字典"""
+    path = Path('/proc/self/smaps_rollup')
+    if not path.exists():
+        return {}
+    fields = {}
+    for line in path.read_text().splitlines()[1:]:
+        name, value, *_ = line.split()
+        fields[name.rstrip(':')] = int(value)       # kB
+    return {'rss_mb': round(fields.get('Rss', 0) / 1024, 1),
+            'pss_mb': round(fields.get('Pss', 0) / 1024, 1),
+            'shared_mb': round((fields.get('Shared_Clean', 0) + fields.get('Shared_Dirty', 0)) / 1024, 1)}
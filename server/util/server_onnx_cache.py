@@ -0,0 +1,64 @@
+"""
+标点模型的 onnxruntime 优化图缓存
+
+onnxruntime 每次创建会话都要对计算图做一遍优化（算子融合、常量折叠等），标点模型较大，这一步很慢。
+第一次启动时把优化后的计算图保存到 models/.ort_cache 下，之后直接加载优化过的模型。
+
+缓存目录以模型文件的哈希、onnxruntime 版本和 CPU 架构命名，模型或运行库更新后自动重新生成。
+保存的是 EXTENDED 级别的优化结果，不含与具体硬件相关的内存布局变换，
+加载时仍按 funasr_onnx 的设置做完整优化，只是需要做的事少了很多。
+"""
+
+import os
+import shutil
+import hashlib
+import platform
+from pathlib import Path
+
+from util.server_cosmic import console
+
+__all__ = ['cached_model_dir']
+
+
+def _file_hash(path: Path) -> str:
+    digest = hashlib.blake2b(digest_size=8)
+    with path.open('rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cached_model_dir(model_dir: Path, model_name: str = 'model_quant.onnx') -> Path:
+    """
+    返回可以代替 model_dir 传给 funasr_onnx 的目录，其中的 model_name 是优化过的计算图，
+    其余文件从 model_dir 复制。生成缓存失败时返回原目录。
+    """
+    try:
+        import onnxruntime as ort
+
+        source = model_dir / model_name
+        key = f'{_file_hash(source)}-ort{ort.__version__}-{platform.machine().lower()}'
+        cache = model_dir.parent / '.ort_cache' / f'{model_dir.name}-{key}'
+        if (cache / model_name).exists():
+            return cache
+
+        # 先写到临时目录，完成后再改名，多个识别进程同时生成也不会读到写了一半的文件
+        temp = cache.with_name(f'{cache.name}.{os.getpid()}.tmp')
+        temp.mkdir(parents=True, exist_ok=True)
+        for file in model_dir.iterdir():
+            if file.is_dir():
+                shutil.copytree(file, temp / file.name, dirs_exist_ok=True)
+            elif file.suffix != '.onnx':
+                shutil.copy2(file, temp / file.name)
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+        options.optimized_model_filepath = str(temp / model_name)
+        ort.InferenceSession(str(source), options, providers=['CPUExecutionProvider'])
+        try:
+            os.replace(temp, cache)
+        except OSError:
+            shutil.rmtree(temp, ignore_errors=True)     # 其它进程已经生成好了
+        return cache
+    except Exception as e:
+        console.print(f'[yellow]Optimized model cache unavailable: {e}')
+        return model_dir
@@ -0,0 +1,169 @@
+"""
+识别结果的后处理阶段：加标点、中文数字转阿拉伯数字、调整中英之间的空格
+
+识别进程只做声学解码和片段合并，把结果放进后处理队列就去取下一批片段；
+后处理在同一进程的另一个线程里进行（onnxruntime 推理时会释放 GIL），
+声学模型不必等上一个任务的文本格式化完成。
+
+每个任务的结果按到达顺序处理：中间结果带来新增的文字，累积到一定长度就给已说完的句子加标点，
+最终结果到达时只需格式化剩下的尾巴，然后以全文替换 text，放入 queue_out。
+"""
+
+import time
+import threading
+from multiprocessing import Queue
+from queue import Queue as ThreadQueue
+
+from config import ServerConfig as Config
+from util.server_classes import Cancel, Result
+from util.chinese_itn import chinese_to_num
+from util.format_tools import adjust_space
+from util.server_result_store import ResultStore
+from util.server_affinity import pin_thread
+from util.server_cosmic import console
+
+__all__ = ['format_text', 'Formatter', 'StageStats', 'postprocess']
+
+
+# 标点模型会插入的标点，其中句号和问号是句末
+PUNCS = '，。？、'
+SENTENCE_ENDS = '。？'
+
+
+def format_text(text, punc_model):
+    if Config.format_spell:
+        text = adjust_space(text)       # 调空格
+    if Config.format_punc and punc_model and text:
+        text = punc_model(text)[0]  # 加标点
+    if Config.format_num:
+        text = chinese_to_num(text)     # 转数字
+    if Config.format_spell:
+        text = adjust_space(text)       # 调空格
+    return text
+
+
+def _plain(text: str) -> str:
+    """去掉空格和标点，用于比较加标点前后的文字是否对应"""
+    return ''.join(c for c in text if not c.isspace() and c not in PUNCS).lower()
+
+
+class Formatter:
+    """一个任务的格式化状态：已格式化完成的句子，和还没有格式化的文字"""
+
+    def __init__(self):
+        self.formatted = []
+        self.unformatted = ''
+
+    def feed(self, text: str, punc_model):
+        """
+        长文本分块加标点。
+
+        未格式化的文字超过 punc_chunk 字时，只对这部分文字加标点，
+        最后一个句末标点（其后至少还有 punc_context 字）之前的句子已有足够的上下文，
+        格式化后存入 formatted；之后不完整的句子留在 unformatted，作为下一次的上文。
+        每次调用的开销与 punc_chunk 有关，与全文长度无关。
+        """
+        raw = self.unformatted = self.unformatted + text
+        if not (Config.format_punc and punc_model) or len(raw) < Config.punc_chunk:
+            return
+
+        if Config.format_spell:
+            raw = adjust_space(raw)
+        punctuated = punc_model(raw)[0]
+        limit = len(punctuated) - Config.punc_context
+        end = max(punctuated.rfind(c, 0, limit) for c in SENTENCE_ENDS)
+        if end < 0 and len(raw) >= Config.punc_chunk * 2:
+            end = punctuated.rfind('，', 0, limit)     # 一直没有句末，退而在逗号处断开，避免积压
+        if end < 0:
+            return
+        sentences = punctuated[:end] + punctuated[end].replace('，', '。')
+
+        # 标点模型只插入标点、调整空格，按文字个数在原文中找到对应的位置
+        count, pos = len(_plain(sentences)), 0
+        while count and pos < len(raw):
+            if not raw[pos].isspace() and raw[pos] not in PUNCS:
+                count -= 1
+            pos += 1
+        if _plain(raw[:pos]) != _plain(sentences):
+            return                  # 对不上时，留到最终结果一起处理
+
+        if Config.format_num:
+            sentences = chinese_to_num(sentences)
+        if Config.format_spell:
+            sentences = adjust_space(sentences)
+        self.formatted.append(sentences)
+        self.unformatted = raw[pos:].lstrip()
+
+    def finish(self, text: str, punc_model) -> str:
+        """最终结果：只剩尾部还没有加标点，格式化后与之前的句子拼成全文"""
+        return ''.join(self.formatted) + format_text(self.unformatted + text, punc_model)
+
+
+class StageStats:
+    """一个处理阶段在上报间隔内的耗时统计，report() 后清零"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.wait = 0.0
+
+    def add(self, seconds: float, wait: float = 0.0):
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+            self.wait = max(self.wait, wait)
+
+    def report(self) -> dict:
+        with self._lock:
+            data = {'count': self.count,
+                    'avg_ms': round(self.total / self.count * 1000, 1) if self.count else 0,
+                    'max_ms': round(self.max * 1000, 1),
+                    'max_wait_ms': round(self.wait * 1000, 1)}
+            self._reset()
+        return data
+
+
+def postprocess(queue_post: ThreadQueue, queue_out: Queue, punc_model, stats: StageStats, cpus=()):
+    """
+    后处理线程：queue_post 中是 (result, 放入时刻)，或者 Cancel，收到 None 时退出
+    cpus 非空时把本线程绑定到这些 CPU 上
+    """
+    pin_thread(cpus)
+    formatters = ResultStore(Config.result_ttl, Config.result_max_entries)
+
+    while True:
+        item = queue_post.get()
+        if item is None:
+            return
+        if isinstance(item, Cancel):
+            formatters.pop(item.task_id, None)
+            continue
+
+        result, time_put = item
+        result: Result
+        t0 = time.perf_counter()
+
+        if result.task_id not in formatters:
+            formatters[result.task_id] = Formatter()
+        formatter = formatters[result.task_id]
+        try:
+            if result.is_final:
+                formatters.pop(result.task_id)
+                result.text = formatter.finish(result.text, punc_model)
+            else:
+                formatter.feed(result.text, punc_model)
+        except Exception as e:
+            # 格式化出错时照常返回结果，只是不加标点，免得客户端一直等不到
+            console.print(f'[red]Post-processing failed for task {result.task_id}: {e!r}')
+            if result.is_final:
+                result.text = ''.join(formatter.formatted) + formatter.unformatted + result.text
+        result.time_complete = time.time()
+
+        stats.add(time.perf_counter() - t0, t0 - time_put)
+        queue_out.put(result)
@@ -0,0 +1,150 @@
+"""
+识别进程里的优先级任务队列
+
+从多进程队列取出片段后按类别排队，取任务的顺序是：
+    1. 麦克风的最终片段（用户已经松开按键，正在等结果）
+    2. 麦克风的中间片段
+    3. 文件转录片段
+
+同一个任务的片段必须按顺序识别（结果要按序合并），
+所以麦克风最终片段到达时，会把同一任务还在排队的中间片段一起提到最高优先级。
+
+为避免长时间听写时文件转录饿死，文件片段已经 file_max_wait 秒没有得到处理时，提前处理一个；
+按时间窗口限速，每个窗口最多提前一个，积压的文件片段不会整体压过麦克风片段。
+
+收到 Cancel 时，清除该任务所有还在排队的片段，并交给 on_cancel 回调（归还共享内存等）。
+
+传入 load（共享内存中的一个整数）时，把排队和正在识别的片段数写到里面，
+主进程的 TaskRouter 据此把新任务分给最空闲的识别进程。
+"""
+
+import time
+from collections import deque
+from multiprocessing import Queue
+from queue import Empty
+
+from util.server_classes import Cancel
+
+__all__ = ['PriorityTaskQueue']
+
+
+MIC_FINAL, MIC, FILE = 'mic_final', 'mic', 'file'
+
+
+class PriorityTaskQueue:
+    def __init__(self, queue: Queue, file_max_wait: float = 5, on_cancel=None, load=None):
+        self.queue = queue
+        self.load = load
+        self.in_flight = 0          # 已经取出、还没有 finish() 的片段数
+        self.file_max_wait = file_max_wait
+        self.on_cancel = on_cancel
+        self.classes = {MIC_FINAL: deque(), MIC: deque(), FILE: deque()}
+        self.served = {MIC_FINAL: 0, MIC: 0, FILE: 0}
+        self.promoted = 0           # 因等待过久而提前的文件片段数
+        self.file_since = 0.0       # 上次处理文件片段（或文件片段开始排队）的时刻
+        self.last_class = None      # 上一个取出的片段所在的类别
+        self.cancelled = 0          # 因取消而丢弃的片段数
+        self.max_wait = {MIC_FINAL: 0.0, MIC: 0.0, FILE: 0.0}
+
+    def __len__(self):
+        return sum(len(q) for q in self.classes.values())
+
+    def _cancel(self, task_id: str):
+        dropped = []
+        for name, q in self.classes.items():
+            if any(t.task_id == task_id for t in q):
+                dropped += [t for t in q if t.task_id == task_id]
+                self.classes[name] = deque(t for t in q if t.task_id != task_id)
+        self.cancelled += len(dropped)
+        if self.on_cancel:
+            self.on_cancel(task_id, dropped)
+
+    def _push(self, task):
+        if isinstance(task, Cancel):
+            self._cancel(task.task_id)
+        elif task.source != 'mic':
+            if not self.classes[FILE]:
+                self.file_since = time.time()
+            self.classes[FILE].append(task)
+        elif not task.is_final:
+            self.classes[MIC].append(task)
+        else:
+            # 把同一任务尚未识别的中间片段提到最终片段之前
+            partials = self.classes[MIC]
+            earlier = [t for t in partials if t.task_id == task.task_id]
+            if earlier:
+                self.classes[MIC] = deque(t for t in partials if t.task_id != task.task_id)
+            self.classes[MIC_FINAL].extend(earlier)
+            self.classes[MIC_FINAL].append(task)
+
+    def _drain(self):
+        while True:
+            try:
+                self._push(self.queue.get_nowait())
+            except Empty:
+                self._publish()
+                return
+
+    def _publish(self):
+        if self.load is not None:
+            self.load.value = len(self) + self.in_flight
+
+    def finish(self, count: int):
+        """取出的 count 个片段已经处理完（识别完或丢弃）"""
+        self.in_flight -= count
+        self._publish()
+
+    def _pending(self, kind: str = None) -> int:
+        return len(self.classes[kind]) if kind else len(self)
+
+    def _pop(self, kind: str = None):
+        name = kind or next(name for name, q in self.classes.items() if q)
+        if not kind and name != FILE and self.classes[FILE] and time.time() - self.file_since > self.file_max_wait:
+            self.promoted += 1
+            name = FILE
+        if name == FILE:
+            self.file_since = time.time()
+        task = self.classes[name].popleft()
+        self.in_flight += 1
+        self.last_class = name
+        self.served[name] += 1
+        self.max_wait[name] = max(self.max_wait[name], time.time() - task.time_submit)
+        return task
+
+    def get_nowait(self, kind: str = None):
+        """只取已经到达的片段，没有时（包括只收到了 Cancel）抛出 Empty；kind 非空时只取这一类"""
+        self._drain()
+        if not self._pending(kind):
+            raise Empty
+        return self._pop(kind)
+
+    def get(self, timeout: float = None, kind: str = None):
+        """
+        取出优先级最高的片段，队列为空时最多阻塞 timeout 秒，超时抛出 Empty
+        等到的可能只是 Cancel，清除后队列仍是空的，继续等待剩余的时间
+        kind 非空时只取这一类的片段，期间到达的其它片段照常排队
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        self._drain()
+        while not self._pending(kind):
+            if deadline is None:
+                self._push(self.queue.get())
+            else:
+                remain = deadline - time.monotonic()
+                if remain <= 0:
+                    raise Empty
+                self._push(self.queue.get(timeout=remain))
+            self._drain()
+        return self._pop(kind)
+
+    def metrics(self) -> dict:
+        """各类别的排队深度、已处理数和最长等待时间（max_wait 读取后清零）"""
+        metrics = {
+            'depth': {name: len(q) for name, q in self.classes.items()},
+            'served': dict(self.served),
+            'max_wait': {name: round(wait, 3) for name, wait in self.max_wait.items()},
+            'file_promoted': self.promoted,
+            'cancelled': self.cancelled,
+        }
+        self.max_wait = {name: 0.0 for name in self.max_wait}
+        return metrics
@@ -1,35 +1,105 @@
 import re
 import time
+from typing import List
 
 import numpy as np 
 
 from util.server_cosmic import console
 from config import ServerConfig as Config
 from util.server_classes import Task, Result
-from util.chinese_itn import chinese_to_num
-from util.format_tools import adjust_space
+from util.server_result_store import ResultStore
 from rich import inspect
 
 
-results = {}
+# 未完成任务的合并状态，超时或超出上限的会被清除
+results = ResultStore(Config.result_ttl, Config.result_max_entries)
 
 
-def format_text(text, punc_model):
-    if Config.format_spell:
-        text = adjust_space(text)       # 调空格
-    if Config.format_punc and punc_model and text:
-        text = punc_model(text)[0]  # 加标点
-    if Config.format_num:
-        text = chinese_to_num(text)     # 转数字
-    if Config.format_spell:
-        text = adjust_space(text)       # 调空格
-    return text
+def join_tokens(tokens: List[str]) -> str:
+    """token 拼成文字：英文 token 之间留空格，@@ 结尾的是半个单词，与下一个 token 直接相连"""
+    text = ' '.join(tokens).replace('@@ ', '')
+    return re.sub('([^a-zA-Z0-9]) (?![a-zA-Z0-9])', r'\1', text)
 
 
-def recognize(recognizer, punc_model, task: Task):
+def append_text(result: Result, tokens: List[str], is_final: bool):
+    """
+    把新合并的 tokens 拼成文字追加到 result.text_parts，
+    结果与对全部 tokens 调用 join_tokens 相同，但每个片段的开销只与新增的 tokens 有关。
+
+    末尾以 @@ 结尾的 token 先留在 result.pending，等下一片段的 token 到来再一起拼接，
+    已追加的文字因此不需要回头修改；最后一个片段会把它们全部拼上。
+    """
+    tokens = result.pending + tokens
+    k = len(tokens)
+    if not is_final:
+        while k and tokens[k - 1].endswith('@@'):
+            k -= 1
+    result.pending = tokens[k:]
+    piece = join_tokens(tokens[:k])
+    if not piece:
+        return
+
+    # 与已有文字的衔接处：两侧都不是英文或数字时不留空格
+    if result.text_parts:
+        last = result.text_parts[-1][-1]
+        if last.isascii() and last.isalnum() or piece[0].isascii() and piece[0].isalnum():
+            piece = ' ' + piece
+    result.text_parts.append(piece)
+
+
+def discard(task_id: str):
+    """任务被取消或连接已断开，丢弃已合并的部分结果"""
+    results.pop(task_id, None)
+
+
+def warmup(recognizer, punc_model, streams: int = 1, seconds: float = 1):
+    """
+    用合成音频做一次识别、加一次标点，让 onnxruntime 完成延迟的内存分配，把模型页换入内存，
+    之后的第一个真实请求就不会比平时慢。不经过 merge，不影响任何任务的结果
+    """
+    t = np.arange(int(16000 * seconds)) / 16000
+    samples = (0.1 * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+    batch = []
+    for _ in range(streams):
+        stream = recognizer.create_stream()
+        stream.accept_waveform(16000, samples)
+        batch.append(stream)
+    if len(batch) == 1:
+        recognizer.decode_stream(batch[0])
+    else:
+        recognizer.decode_streams(batch)
+    if punc_model:
+        punc_model('今天天气不错我们出去走走吧')
+
+
+def recognize(recognizer, task: Task):
+    return recognize_batch(recognizer, [task])[0]
+
+
+def recognize_batch(recognizer, tasks: List[Task]) -> List[Result]:
+    """把多个片段一次送入识别器（decode_streams），再把结果分别合并到各自的 Result"""
+
+    # 片段预处理
+    streams = []
+    for task in tasks:
+        samples = np.frombuffer(task.data, dtype=np.float32)
+        stream = recognizer.create_stream()
+        stream.accept_waveform(task.samplerate, samples)
+        streams.append(stream)
+
+    # 识别片段
+    if len(streams) == 1:
+        recognizer.decode_stream(streams[0])
+    else:
+        recognizer.decode_streams(streams)
+
+    # 按提交顺序合并，同一任务的多个片段也能按序拼接
+    return [merge(task, stream.result) for task, stream in zip(tasks, streams)]
+
+
+def merge(task: Task, stream_result):
 
     # inspect({key:value for key, value in task.__dict__.items() if not key.startswith('_') and key != 'data'})
-    # todo 清空遗存的任务结果
 
     # 确保结果容器存在
     if task.task_id not in results:
@@ -38,62 +108,45 @@ def recognize(recognizer, punc_model, task: Task):
     # 取出结果容器
     result = results[task.task_id]
 
-    # 片段预处理
-    samples = np.frombuffer(task.data, dtype=np.float32)
-    duration = len(samples) / task.samplerate
+    # 片段时长
+    duration = len(task.data) / 4 / task.samplerate
     result.duration += duration - task.overlap
-    if task.is_final:
-        result.duration += task.overlap
-
-    # 识别片段
-    stream = recognizer.create_stream()
-    stream.accept_waveform(task.samplerate, samples)
-    recognizer.decode_stream(stream)
 
     # 记录识别时间
     result.time_start = task.time_start
     result.time_submit = task.time_submit
     result.time_complete = time.time()
 
-    # 先粗去重，依据：字级时间戳
-    m = n = len(stream.result.timestamps)
-    for i, timestamp in enumerate(stream.result.timestamps, start=0):
-        if timestamp > task.overlap / 2: 
-            m = i
-            break
-    for i, timestamp in enumerate(stream.result.timestamps, start=1):
-        n = i
-        if timestamp > duration - task.overlap / 2:
-            break
-    if not result.timestamps:
+    # 先粗去重，依据：字级时间戳（时间戳递增，二分查找边界）
+    # 开头与上一片段重叠 head_overlap 秒，结尾与下一片段重叠 overlap 秒，在停顿处切分的片段没有重叠
+    timestamps = np.asarray(stream_result.timestamps, dtype=np.float64)
+    m = int(np.searchsorted(timestamps, task.head_overlap / 2, side='right'))
+    n = min(int(np.searchsorted(timestamps, duration - task.overlap / 2, side='right')) + 1, len(timestamps))
+    if not result.timestamps or not task.head_overlap:
         m = 0
     if task.is_final:
-        n = len(stream.result.timestamps)
+        n = len(timestamps)
 
-    # 再细去重，依据：在端点是否有重复的字
-    if result.tokens and result.tokens[-2:] == stream.result.tokens[m:n][:2]:
-        m += 2
-    elif result.tokens and result.tokens[-1:] == stream.result.tokens[m:n][:1]:
-        m += 1
+    # 再细去重，依据：在端点是否有重复的字（没有重叠时不去重）
+    tokens = stream_result.tokens
+    if task.head_overlap and result.tokens:
+        if result.tokens[-2:] == tokens[m:n][:2]:
+            m += 2
+        elif result.tokens[-1:] == tokens[m:n][:1]:
+            m += 1
 
     # 最后与先前的结果合并
-    result.timestamps += [t + task.offset for t in stream.result.timestamps[m:n]]
-    result.tokens += [token for token in stream.result.tokens[m:n]]
+    result.timestamps += (timestamps[m:n] + task.offset).tolist()
+    result.tokens += tokens[m:n]
 
-    # token 合并为文本
-    text = ' '.join(result.tokens).replace('@@ ', '')
-    text = re.sub('([^a-zA-Z0-9]) (?![a-zA-Z0-9])', r'\1', text)
-
-    result.text = text
+    # 只把新合并的 token 拼成文字，追加到已有文字之后
+    append_text(result, tokens[m:n], task.is_final)
 
     if not task.is_final:
-        return result
-
-    # 调整文本格式
-    result.text = format_text(text, punc_model)
+        return result.snapshot()
 
     # 若最后一个片段完成识别，从字典摘取任务
     result = results.pop(task.task_id)
     result.is_final = True
 
-    return result
+    return result.snapshot()
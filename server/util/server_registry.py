@@ -0,0 +1,67 @@
+"""
+跨进程共享的连接登记表
+
+每个连接占用共享内存中的一个槽位，槽位里存放这个连接的代号（generation）。
+连接建立时由接收进程写入一个新的代号，断开时清零；
+片段携带 (槽位, 代号)，识别进程只需读一次共享内存、比较一个整数，就能知道连接是否还在，
+不需要经过 Manager 进程，也不需要加锁。代号从不重复使用，槽位被新连接复用也不会误判。
+"""
+
+from multiprocessing import shared_memory
+from typing import Optional, Tuple
+
+__all__ = ['ConnectionRegistry']
+
+
+class ConnectionRegistry:
+    def __init__(self, size: int):
+        self.size = size
+        self._shm = shared_memory.SharedMemory(create=True, size=size * 8)
+        self._gens = self._shm.buf.cast('Q')
+        for i in range(size):
+            self._gens[i] = 0
+        self._free = list(range(size - 1, -1, -1))
+        self._next_gen = 1
+        self._owner = True
+
+    # 传给子进程时只传名字，子进程里重新连接同一块共享内存
+    def __getstate__(self):
+        return {'name': self._shm.name, 'size': self.size}
+
+    def __setstate__(self, state):
+        self.size = state['size']
+        self._shm = shared_memory.SharedMemory(name=state['name'])
+        self._gens = self._shm.buf.cast('Q')
+        self._free = []
+        self._owner = False
+
+    def register(self) -> Optional[Tuple[int, int]]:
+        """接收进程调用：登记新连接，返回 (槽位, 代号)，槽位用尽时返回 None"""
+        if not self._free:
+            return None
+        slot = self._free.pop()
+        gen = self._next_gen
+        self._next_gen += 1
+        self._gens[slot] = gen
+        return slot, gen
+
+    def unregister(self, conn: Tuple[int, int]):
+        """接收进程调用：连接断开，之后所有带着这个代号的片段都会被识别进程丢弃"""
+        slot, gen = conn
+        if self._gens[slot] == gen:
+            self._gens[slot] = 0
+            self._free.append(slot)
+
+    def alive(self, conn: Tuple[int, int]) -> bool:
+        slot, gen = conn
+        return self._gens[slot] == gen
+
+    def close(self):
+        self._gens.release()
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+    def __del__(self):
+        # 先释放整数视图，共享内存对象才能正常关闭
+        self._gens.release()
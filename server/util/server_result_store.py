@@ -0,0 +1,67 @@
+"""
+识别进程中保存未完成任务合并状态的容器
+
+用法与 dict 相同，但有上限：
+    超过 ttl 秒没有新片段的任务会被清除（上传中断、客户端掉线后遗留的结果）；
+    条目数超过 max_entries 时，清除最久没有更新的任务。
+长时间运行的服务端内存不会因遗留的结果而持续增长。
+"""
+
+import time
+from collections import OrderedDict
+
+__all__ = ['ResultStore']
+
+
+class ResultStore:
+    def __init__(self, ttl: float = 600, max_entries: int = 1000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._items = OrderedDict()      # task_id -> (最后访问时间, Result)，按访问顺序排列
+        self.expired = 0                # 因超时被清除的数量
+        self.evicted = 0                # 因超出上限被清除的数量
+
+    def _evict(self):
+        deadline = time.monotonic() - self.ttl
+        while self._items:
+            task_id, (touched, _) = next(iter(self._items.items()))
+            if touched >= deadline:
+                break
+            self._items.popitem(last=False)
+            self.expired += 1
+        while len(self._items) > self.max_entries:
+            self._items.popitem(last=False)
+            self.evicted += 1
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, task_id):
+        self._evict()
+        return task_id in self._items
+
+    def __getitem__(self, task_id):
+        _, result = self._items[task_id]
+        self._items[task_id] = (time.monotonic(), result)
+        self._items.move_to_end(task_id)
+        return result
+
+    def __setitem__(self, task_id, result):
+        self._items[task_id] = (time.monotonic(), result)
+        self._items.move_to_end(task_id)
+        self._evict()
+
+    def items(self):
+        self._evict()
+        return [(task_id, result) for task_id, (_, result) in self._items.items()]
+
+    def pop(self, task_id, *default):
+        if task_id in self._items:
+            return self._items.pop(task_id)[1]
+        if default:
+            return default[0]
+        raise KeyError(task_id)
+
+    def metrics(self) -> dict:
+        self._evict()
+        return {'entries': len(self._items), 'expired': self.expired, 'evicted': self.evicted}
@@ -0,0 +1,56 @@
+"""
+把片段分派给多个识别进程
+
+同一个 task_id 的片段必须交给同一个识别进程，因为分段结果的合并状态
+（server_recognize.results）保存在识别进程里；
+新任务分给待处理片段最少的识别进程，一样多时轮流分配。
+
+各识别进程把自己排队和正在识别的片段数写在共享内存 loads 里（见 PriorityTaskQueue），
+识别进程会把多进程队列里的片段一次性取到本地排队，只看 qsize 会把忙碌的进程当成空闲的。
+"""
+
+from multiprocessing import Queue
+from typing import Dict, List, Tuple
+
+from util.server_classes import Cancel
+
+__all__ = ['TaskRouter']
+
+
+class TaskRouter:
+    def __init__(self, queues: List[Queue], loads: List = ()):
+        self.queues = queues
+        self.loads = loads          # 各识别进程待处理的片段数，multiprocessing.RawValue
+        self.affinity: Dict[str, Tuple[int, str]] = {}     # task_id -> (识别进程序号, socket_id)
+        self.next = 0               # 轮流分配的起点
+
+    def depth(self, worker: int) -> int:
+        """识别进程已取到本地的片段数，加上还在多进程队列里的片段数"""
+        depth = self.loads[worker].value if self.loads else 0
+        try:
+            return depth + self.queues[worker].qsize()
+        except NotImplementedError:     # macOS 没有 qsize，退而加上进行中的任务数
+            return depth + sum(1 for w, _ in self.affinity.values() if w == worker)
+
+    def put(self, task):
+        route = self.affinity.get(task.task_id)
+        if route is None:
+            count = len(self.queues)
+            order = [(self.next + i) % count for i in range(count)]
+            worker = min(order, key=self.depth)
+            self.next = (worker + 1) % count
+            route = self.affinity[task.task_id] = (worker, task.socket_id)
+        if task.is_final:
+            self.affinity.pop(task.task_id, None)
+        self.queues[route[0]].put(task)
+
+    def cancel(self, task_id: str):
+        """通知负责该任务的识别进程，丢弃它还在排队的片段"""
+        route = self.affinity.pop(task_id, None)
+        if route is not None:
+            self.queues[route[0]].put(Cancel(task_id))
+
+    def discard(self, socket_id: str):
+        """连接断开时，取消它还没有结束的任务"""
+        for task_id in [k for k, (_, s) in self.affinity.items() if s == socket_id]:
+            self.cancel(task_id)
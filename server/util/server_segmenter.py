@@ -0,0 +1,156 @@
+"""
+决定缓冲区里的音频在哪里切成片段
+
+固定模式：缓冲达到 seg_duration + seg_overlap * 2 秒时，切出 seg_duration + seg_overlap 秒，
+    前进 seg_duration 秒，相邻片段重叠 seg_overlap 秒，由识别进程依据时间戳去重。
+
+静音模式：缓冲达到 seg_duration + seg_overlap 秒时，在 [seg_duration - seg_overlap, seg_duration + seg_overlap]
+    范围内找能量最低的一段（停顿），从停顿中间切开，片段之间不重叠，不会重复识别，也不会把字切断。
+    找不到明显停顿（连续说话）时，退回固定模式。
+
+短句模式（phrase > 0，用于麦克风听写）：缓冲达到 phrase 秒后，只要最近 300ms 出现停顿就立即切出，
+    让识别进程在用户还在说话时就识别已经说完的短句，松开按键后只需识别最后一小段。
+"""
+
+from typing import Optional, Tuple
+
+import numpy as np
+
+__all__ = ['plan_cut', 'find_pause', 'frame_energy', 'FrameEnergy']
+
+
+RATE = 16000
+FRAME = RATE // 50              # 20ms 一帧
+SMOOTH = 10                     # 以 200ms 为窗口平滑能量，避免切在字与字之间极短的间隙
+PHRASE_TAIL = RATE * 3 // 10    # 短句模式只在最近 300ms 里找停顿
+PHRASE_CONTEXT = RATE * 5       # 短句模式以最近 5 秒的音量作为说话音量
+
+
+def frame_energy(samples: np.ndarray) -> np.ndarray:
+    """每 20ms 一帧的均方根能量"""
+    frames = samples[:len(samples) // FRAME * FRAME].reshape(-1, FRAME)
+    return np.sqrt(np.mean(frames.astype(np.float64) ** 2, axis=1))
+
+
+class FrameEnergy:
+    """
+    缓冲区中音频逐帧的能量及其 200ms 平滑值，帧与缓冲区开头对齐，每个连接一个
+
+    每 50ms 收到一帧时只计算新写满的帧，切分后丢弃已切出的帧，
+    不必每次都把整个回看窗口（短句 5 秒、静音模式十几秒）重新算一遍
+    """
+
+    def __init__(self):
+        self.energy = np.empty(0)
+        self.smooth = np.empty(0)   # smooth[i] 是 energy[i:i + SMOOTH] 的均值
+        self.frames = 0
+        self.searched = {}          # 模式 -> 上次没找到停顿的 (起, 止, 比例)，帧不变时结果也不变
+
+    def __len__(self):
+        return self.frames
+
+    def update(self, data: memoryview):
+        """data 是缓冲区中 float32 的全部音频，补算新写满的帧"""
+        n = len(data) // 4 // FRAME
+        if n < self.frames:                     # 缓冲区被清空过
+            self.clear()
+        if n == self.frames:
+            return
+        if n > len(self.energy):
+            size = max(n, 2 * len(self.energy))
+            self.energy = np.resize(self.energy, size)
+            self.smooth = np.resize(self.smooth, size)
+        samples = np.frombuffer(data, dtype=np.float32,
+                                count=(n - self.frames) * FRAME, offset=4 * FRAME * self.frames)
+        self.energy[self.frames:n] = frame_energy(samples)
+        if n >= SMOOTH:
+            lo = max(0, self.frames - SMOOTH + 1)
+            self.smooth[lo:n - SMOOTH + 1] = np.convolve(self.energy[lo:n], np.ones(SMOOTH) / SMOOTH, mode='valid')
+        self.frames = n
+
+    def consume(self, samples: int):
+        """缓冲区丢弃了开头 samples 个采样点，切点不在帧边界上时全部重算"""
+        self.searched.clear()
+        if samples % FRAME:
+            self.clear()
+            return
+        k = min(samples // FRAME, self.frames)
+        remain = self.frames - k
+        self.energy[:remain] = self.energy[k:self.frames]
+        self.smooth[:max(0, remain - SMOOTH + 1)] = self.smooth[k:max(k, self.frames - SMOOTH + 1)]
+        self.frames = remain
+
+    def clear(self):
+        self.frames = 0
+        self.searched.clear()
+
+
+def _percentile90(values: np.ndarray) -> float:
+    """与 np.percentile(values, 90) 相同，只做一次部分排序，省去 np.percentile 几十微秒的固定开销"""
+    pos = 0.9 * (len(values) - 1)
+    k = int(pos)
+    if k + 1 >= len(values):
+        return float(np.max(values))
+    part = np.partition(values, (k, k + 1))
+    return float(part[k] + (part[k + 1] - part[k]) * (pos - k))
+
+
+def find_pause(energy: FrameEnergy, start: int, end: int, silence_ratio: float, base: int = 0) -> Optional[int]:
+    """
+    在第 start 到 end 帧中找能量最低的 200ms，返回其中心的采样点位置；
+    以第 base 到 end 帧 90 分位的能量作为说话音量，最低能量高于它的 silence_ratio 倍时，
+    认为没有停顿，返回 None
+    """
+    hi = end - SMOOTH + 1
+    if hi <= start:
+        return None
+    smooth = energy.smooth[start:hi]
+    i = int(np.argmin(smooth))
+    if smooth[i] > _percentile90(energy.energy[base:end]) * silence_ratio:
+        return None
+    return (start + i + SMOOTH // 2) * FRAME
+
+
+def _search(energy: FrameEnergy, mode: str, start: int, end: int, silence_ratio: float,
+            base: int = 0) -> Optional[int]:
+    """同一段帧上已经找过、没有停顿时直接返回 None"""
+    key = start, end, silence_ratio
+    if energy.searched.get(mode) == key:
+        return None
+    cut = find_pause(energy, start, end, silence_ratio, base)
+    if cut is None:
+        energy.searched[mode] = key
+    return cut
+
+
+def plan_cut(data: memoryview, seg_duration: float, seg_overlap: float,
+             silence: bool, silence_ratio: float = 0.1,
+             phrase: float = 0, energy: FrameEnergy = None) -> Optional[Tuple[int, int, float]]:
+    """
+    data 是缓冲区中 float32 的音频，返回 (片段字节数, 缓冲区前进字节数, 片段重叠秒数)，
+    音频还不够切出一个片段时返回 None
+
+    energy 是该缓冲区的 FrameEnergy，调用方在缓冲区 consume 时同步 consume，
+    不传时每次从头计算
+    """
+    length = len(data) // 4
+    if energy is None:
+        energy = FrameEnergy()
+    if phrase or silence:
+        energy.update(data)
+    if phrase and length >= RATE * phrase:
+        frames = len(energy)
+        cut = _search(energy, 'phrase', (length - PHRASE_TAIL) // FRAME, frames, silence_ratio,
+                      max(0, frames - PHRASE_CONTEXT // FRAME))
+        if cut is not None:
+            return 4 * cut, 4 * cut, 0
+    if silence and length >= RATE * (seg_duration + seg_overlap):
+        cut = _search(energy, 'silence',
+                      int(RATE * (seg_duration - seg_overlap)) // FRAME,
+                      int(RATE * (seg_duration + seg_overlap)) // FRAME,
+                      silence_ratio)
+        if cut is not None:
+            return 4 * cut, 4 * cut, 0
+    if length >= RATE * (seg_duration + seg_overlap * 2):
+        return 4 * int(RATE * (seg_duration + seg_overlap)), 4 * int(RATE * seg_duration), seg_overlap
+    return None
@@ -0,0 +1,89 @@
+"""
+跨进程共享的音频片段池
+
+接收进程把片段的 PCM 写进共享内存的一个槽位，队列里只传递槽位号和长度，
+识别进程直接从共享内存解码，省去 pickle、管道传输和反序列化的拷贝。
+
+共享内存的布局：开头是每个槽位一个字节的占用标记，之后是等长的数据槽。
+只有接收进程会把标记置 1（分配），只有取走任务的识别进程会把它置 0（释放），
+所以不需要锁。没有空闲槽位或片段太长时，退回到在 Task 里直接携带 bytes。
+"""
+
+from multiprocessing import shared_memory
+
+__all__ = ['SharedAudioPool']
+
+
+_HEADER_ALIGN = 64
+
+
+class SharedAudioPool:
+    def __init__(self, slots: int, slot_size: int):
+        self.slots = slots
+        self.slot_size = slot_size
+        self._header = -(-slots // _HEADER_ALIGN) * _HEADER_ALIGN
+        self._shm = shared_memory.SharedMemory(create=True, size=self._header + slots * slot_size)
+        self._shm.buf[:slots] = bytes(slots)
+        self._cursor = 0
+        self._owner = True
+
+    # 传给子进程时只传名字，子进程里重新连接同一块共享内存
+    def __getstate__(self):
+        return {'name': self._shm.name, 'slots': self.slots, 'slot_size': self.slot_size}
+
+    def __setstate__(self, state):
+        self.slots = state['slots']
+        self.slot_size = state['slot_size']
+        self._header = -(-self.slots // _HEADER_ALIGN) * _HEADER_ALIGN
+        self._shm = shared_memory.SharedMemory(name=state['name'])
+        self._cursor = 0
+        self._owner = False
+
+    def _acquire(self):
+        flags = self._shm.buf
+        for i in range(self.slots):
+            slot = (self._cursor + i) % self.slots
+            if not flags[slot]:
+                flags[slot] = 1
+                self._cursor = slot + 1
+                return slot
+        return None
+
+    def put(self, task):
+        """
+        接收进程调用：把 task.data 写入空闲槽位，task 里只留下槽位描述；
+        放不下时把 task.data 转成 bytes，照旧随队列传输
+        """
+        size = len(task.data)
+        slot = self._acquire() if size <= self.slot_size else None
+        if slot is None:
+            task.data = bytes(task.data)
+            return task
+        start = self._header + slot * self.slot_size
+        self._shm.buf[start:start + size] = task.data
+        task.data = None
+        task.slot = slot
+        task.size = size
+        return task
+
+    def get(self, task):
+        """识别进程调用：让 task.data 指向共享内存中的片段（零拷贝视图）"""
+        if task.slot is not None:
+            start = self._header + task.slot * self.slot_size
+            task.data = self._shm.buf[start:start + task.size]
+        return task
+
+    def release(self, task):
+        """识别进程调用：片段已经送入识别器，归还槽位"""
+        if task.slot is None:
+            return
+        if isinstance(task.data, memoryview):
+            task.data.release()
+        task.data = None
+        self._shm.buf[task.slot] = 0
+        task.slot = None
+
+    def close(self):
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
@@ -0,0 +1,39 @@
+"""
+本机测出的最佳进程、线程配置
+
+benchmark_server.py tune 在本机测量各种识别进程数、推理线程数、是否绑定 CPU 的组合，
+把最好的一组写入 server/tuned.json；服务端启动时读取它，覆盖 config.py 中的默认值。
+删除 tuned.json 即恢复默认。
+"""
+
+import json
+from pathlib import Path
+
+from config import ServerConfig, ParaformerArgs
+
+__all__ = ['TUNED_FILE', 'load_tuning', 'save_tuning']
+
+
+TUNED_FILE = Path(__file__).resolve().parent.parent / 'tuned.json'
+
+# tuned.json 中各节对应的配置类
+SECTIONS = {'server': ServerConfig, 'paraformer': ParaformerArgs}
+
+
+def load_tuning() -> dict:
+    """读取 tuned.json，把其中的值写到对应的配置类上，文件不存在或无效时什么都不做"""
+    try:
+        with TUNED_FILE.open('r', encoding='utf-8') as fp:
+            data = json.load(fp)
+    except (OSError, ValueError):
+        return {}
+    for section, target in SECTIONS.items():
+        for key, value in data.get(section, {}).items():
+            if hasattr(target, key):
+                setattr(target, key, value)
+    return data
+
+
+def save_tuning(data: dict):
+    with TUNED_FILE.open('w', encoding='utf-8') as fp:
+        json.dump(data, fp, ensure_ascii=False, indent=2)
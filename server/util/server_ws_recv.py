@@ -7,6 +7,9 @@ from base64 import b64decode
 
 from util.server_cosmic import console, Cosmic
 from util.server_classes import Task, Result
+from util.server_audio_buffer import AudioBuffer
+from util.server_segmenter import plan_cut, FrameEnergy
+from config import ServerConfig as Config
 from util.my_status import Status
 
 status_mic = Status('正在接收音频', spinner='point')
@@ -15,20 +18,39 @@ status_mic = Status('正在接收音频', spinner='point')
 class Cache:
     # 定义一个可变对象，用于保存音频数据、偏移时间
     def __init__(self):
-        self.chunks = b''
+        self.buffer = AudioBuffer()
+        self.energy = FrameEnergy()     # 缓冲区逐帧能量，每帧只算一次，供找停顿用
         self.offset = 0
+        self.overlap = 0        # 上一个片段与下一个片段的重叠秒数
         self.frame_num = 0
+        self.meta = None        # 二进制模式下，由 stream_start 消息携带的元数据
+        self.task_id = None     # 正在接收的任务
+        self.conn = None        # 连接在 ConnectionRegistry 中的 (槽位, 代号)
+
+    def reset(self):
+        self.buffer.clear()
+        self.energy.clear()
+        self.offset = 0
+        self.overlap = 0
+        self.frame_num = 0
+        self.meta = None
+        self.task_id = None
 
 
-async def message_handler(websocket, message, cache: Cache):
-    """处理得到的音频流数据"""
+async def message_handler(websocket, message, cache: Cache, data: bytes = None):
+    """处理得到的音频流数据
+
+    message 是元数据（task_id、seg_duration、is_final、time_start 等），
+    data 是二进制帧直接带来的 PCM，为 None 时从 message['data'] 的 base64 解码（兼容旧客户端）
+    """
 
     queue_in = Cosmic.queue_in
+    audio_pool = Cosmic.audio_pool
 
     global status_mic
     source = message['source']
     is_final = message['is_final']
-    is_start = not bool(cache.chunks)
+    is_start = not cache.frame_num
 
     # 获取 id
     task_id = message['task_id']
@@ -40,11 +62,16 @@ async def message_handler(websocket, message, cache: Cache):
     seg_threshold = seg_duration + seg_overlap * 2
 
 
-    # base64 解码音频数据，再
     # 音频数据是 float32、单声道、16000采样率
-    data = b64decode(message['data'])
-    cache.chunks += data
+    # 旧的 JSON 模式下，音频以 base64 放在 message['data'] 中
+    if data is None:
+        data = b64decode(message['data'])
     cache.frame_num += len(data)
+    cache.task_id = task_id
+
+    # 缓冲区容量为一个分段阈值，写满即切出片段，内存有界
+    buffer = cache.buffer
+    buffer.reserve(4 * 16000 * seg_threshold)
 
     if not is_final:
         # 打印消息
@@ -53,20 +80,37 @@ async def message_handler(websocket, message, cache: Cache):
         if source == 'file' and is_start:
             console.print('正在接收音频文件...')
 
-        # 若缓冲已达到分段长度，将片段作为任务提交
-        while len(cache.chunks) / 4 / 16000 >= seg_threshold:
-            data = cache.chunks[:4 * 16000 * (seg_duration + seg_overlap)]
-            cache.chunks = cache.chunks[4 * 16000 * seg_duration:]
-            task = Task(source=message['source'],
-                        data=data, offset=cache.offset,
-                        task_id=task_id, socket_id=socket_id,
-                        overlap=seg_overlap, is_final=False,
-                        time_start=message['time_start'],
-                        time_submit=time.time())
-            cache.offset += seg_duration
-            queue_in.put(task)
-
-    elif is_final:
+    # 麦克风听写时，说完一个短句（出现停顿）就先提交识别，松开按键后只剩最后一段要识别
+    phrase = Config.predecode_min if Config.predecode and source == 'mic' and not is_final else 0
+
+    # 写入缓冲区，若缓冲已达到分段长度，将片段作为任务提交
+    # 优先在停顿处切分（片段间不重叠），找不到停顿时按固定时长加重叠切分
+    view = memoryview(data)
+    while True:
+        view = view[buffer.write(view):]
+        cut = plan_cut(buffer.peek(), seg_duration, seg_overlap,
+                       Config.seg_silence, Config.seg_silence_ratio, phrase, cache.energy)
+        if cut is None and view:                # 缓冲区已满（分段参数在中途变大），整段切出
+            cut = len(buffer), len(buffer), 0
+        if cut is None:
+            break
+        size, step, overlap = cut
+        task = Task(source=message['source'],
+                    data=buffer.peek(size),
+                    offset=cache.offset,
+                    task_id=task_id, socket_id=socket_id,
+                    overlap=overlap, is_final=False,
+                    time_start=message['time_start'],
+                    time_submit=time.time(),
+                    conn=cache.conn,
+                    head_overlap=cache.overlap)
+        queue_in.put(audio_pool.put(task))      # 片段写入共享内存，队列只传描述
+        buffer.consume(step)
+        cache.energy.consume(step // 4)
+        cache.offset += step / 4 / 16000
+        cache.overlap = overlap
+
+    if is_final:
         # 打印消息
         if source == 'mic':
             status_mic.stop()
@@ -75,17 +119,17 @@ async def message_handler(websocket, message, cache: Cache):
 
         # 客户端说片段结束，将缓冲区音频识别
         task = Task(source=message['source'],
-                    data=cache.chunks[0:], offset=cache.offset,
+                    data=buffer.peek(), offset=cache.offset,
                     task_id=task_id, socket_id=socket_id,
-                    overlap=seg_overlap, is_final=True,
+                    overlap=0, is_final=True,
                     time_start=message['time_start'],
-                    time_submit=time.time())
-        queue_in.put(task)
+                    time_submit=time.time(),
+                    conn=cache.conn,
+                    head_overlap=cache.overlap)
+        queue_in.put(audio_pool.put(task))
 
         # 还原缓冲区、偏移时长
-        cache.chunks = b''
-        cache.offset = 0
-        cache.frame_num = 0
+        cache.reset()
 
 
 async def ws_recv(websocket):
@@ -93,9 +137,7 @@ async def ws_recv(websocket):
 
     # 登记 socket 到字典，以 socket id 字符串为索引
     sockets = Cosmic.sockets
-    sockets_id = Cosmic.sockets_id
     sockets[str(websocket.id)] = websocket
-    sockets_id.append(str(websocket.id))
     console.print(f'接客了：{websocket}\n', style='yellow')
 
     # 设定分段长度
@@ -106,15 +148,58 @@ async def ws_recv(websocket):
     # 片段缓冲区、偏移时长
     cache = Cache()
 
+    # 在共享登记表中登记连接，识别进程据此丢弃已断开连接的片段
+    cache.conn = Cosmic.registry.register()
+    if cache.conn is None:
+        console.print('连接数已达上限，拒绝连接', style='bright_red')
+        sockets.pop(str(websocket.id))
+        await websocket.close(1013, 'too many connections')
+        return
+
     # 接收数据
     try:
         async for message in websocket:
 
+            # 二进制帧：原始 PCM，元数据取自此前的 stream_start 消息
+            if isinstance(message, bytes):
+                if cache.meta is None:
+                    continue
+                await message_handler(websocket, cache.meta, cache, message)
+                continue
+
             # json 解码字符串
             message = json.loads(message)
 
+            # 查询服务端运行指标
+            if message.get('type') == 'metrics':
+                await websocket.send(json.dumps({'type': 'metrics', 'metrics': Cosmic.metrics}))
+                continue
+
+            # 客户端协商结果格式：fields 要哪些字段，partial 是否接收中间结果，
+            # delta 为真时只发送新增的 tokens、timestamps
+            if message.get('type') == 'subscribe':
+                Cosmic.subscriptions[str(websocket.id)] = message
+                continue
+
+            # 客户端取消任务：丢弃接收缓冲，并通知识别进程清除还在排队的片段
+            if message.get('type') == 'cancel':
+                if cache.task_id == message['task_id'] or (cache.meta or {}).get('task_id') == message['task_id']:
+                    if cache.meta and cache.meta.get('source') == 'mic':
+                        status_mic.stop()
+                    cache.reset()
+                Cosmic.queue_in.cancel(message['task_id'])
+                Cosmic.transcripts.pop(message['task_id'], None)
+                continue
+
+            # 二进制模式的开始消息，只记录元数据，音频随后以二进制帧发送
+            if message.get('type') == 'stream_start':
+                cache.meta = {**message, 'is_final': False}
+                continue
+
             # 处理数据
             await message_handler(websocket, message, cache)
+            if message['is_final']:
+                cache.meta = None
 
         console.print("ConnectionClosed...", )
     except websockets.ConnectionClosed:
@@ -127,4 +212,8 @@ async def ws_recv(websocket):
         status_mic.stop()
         status_mic.on = False
         sockets.pop(str(websocket.id))
-        sockets_id.remove(str(websocket.id))
+        Cosmic.subscriptions.pop(str(websocket.id), None)
+        for task_id in [k for k, v in Cosmic.transcripts.items() if v[0] == str(websocket.id)]:
+            Cosmic.transcripts.pop(task_id)
+        Cosmic.registry.unregister(cache.conn)
+        Cosmic.queue_in.discard(str(websocket.id))
@@ -2,6 +2,7 @@ import json
 import base64 
 import asyncio
 from multiprocessing import Queue
+from typing import Optional
 
 from util.server_cosmic import console, Cosmic
 from util.server_classes import Result
@@ -9,6 +10,61 @@ from util.asyncio_to_thread import to_thread
 from rich import inspect
 
 
+# 可供订阅的结果字段，task_id 和 is_final 总是发送
+RESULT_FIELDS = ('duration', 'time_start', 'time_submit', 'time_complete', 'tokens', 'timestamps', 'text')
+
+
+def build_message(result: Result) -> Optional[dict]:
+    """
+    按连接在 subscribe 消息中的协商构建结果消息：
+        fields   只序列化这些字段，默认全部
+        partial  为假时不发送中间结果，返回 None
+        delta    为真时只发送新增的 tokens、timestamps（带 seq、start），中间结果不带 text，
+                 fields 中没有 tokens 和 timestamps 时不起作用
+
+    识别进程发来的 result 只带新增的 tokens、timestamps，中间结果的 text 也只是新增的文字，
+    不接收每一条增量的连接，在这里累积成全文再发送。
+    """
+    subscription = Cosmic.subscriptions.get(result.socket_id, {})
+    fields = subscription.get('fields') or RESULT_FIELDS
+    partial = subscription.get('partial', True)
+    # 增量是针对 tokens、timestamps 的，两者都没有订阅时客户端无从拼接，按全文发送
+    delta = subscription.get('delta', False) and partial and ('tokens' in fields or 'timestamps' in fields)
+
+    tokens, timestamps, text = result.tokens, result.timestamps, result.text
+    partial_text = partial and 'text' in fields
+    if not delta and ('tokens' in fields or 'timestamps' in fields or partial_text):
+        if result.task_id not in Cosmic.transcripts:
+            Cosmic.transcripts[result.task_id] = (result.socket_id, [], [], [])
+        _, tokens, timestamps, texts = Cosmic.transcripts[result.task_id]
+        tokens += result.tokens
+        timestamps += result.timestamps
+        if result.is_final:
+            Cosmic.transcripts.pop(result.task_id)
+        elif partial_text:
+            texts.append(result.text)
+            text = ''.join(texts)
+
+    if not partial and not result.is_final:
+        return None
+
+    message = {'task_id': result.task_id, 'is_final': result.is_final}
+    if delta:
+        message['seq'] = result.seq
+        message['start'] = result.start
+    for field in fields:
+        if field == 'tokens':
+            message['tokens'] = tokens
+        elif field == 'timestamps':
+            message['timestamps'] = timestamps
+        elif field == 'text':
+            if result.is_final or not delta:
+                message['text'] = text
+        elif field in RESULT_FIELDS:
+            message[field] = getattr(result, field)
+    return message
+
+
 async def ws_send():
 
     queue_out = Cosmic.queue_out
@@ -23,20 +79,13 @@ async def ws_send():
             if result is None:
                 return
 
-            # 构建消息
-            message = {
-                'task_id': result.task_id,
-                'duration': result.duration,
-                'time_start': result.time_start,
-                'time_submit': result.time_submit,
-                'time_complete': result.time_complete,
-                'tokens': result.tokens,
-                'timestamps': result.timestamps,
-                'text': result.text,
-                'is_final': result.is_final,
-            }
-
-            # 获得 socket
+            # 识别进程上报的运行指标
+            if isinstance(result, dict):
+                if result.get('type') == 'metrics':
+                    Cosmic.metrics[result['source']] = result['data']
+                continue
+
+            # 获得 socket，连接已断开时丢弃结果，也不再为它累积全文
             websocket = next(
                 (ws for ws in sockets.values() if str(ws.id) == result.socket_id),
                 None,
@@ -45,10 +94,14 @@ async def ws_send():
             if not websocket:
                 continue
 
-            # 发送消息
-            await websocket.send(json.dumps(message))
+            # 构建消息
+            message = build_message(result)
+
+            # 发送消息（连接未订阅中间结果时 message 为 None）
+            if message is not None:
+                await websocket.send(json.dumps(message))
 
-            if result.source == 'mic':
+            if result.source == 'mic' and result.is_final:
                 console.print(f'识别结果：\n    [green]{result.text}')
             elif result.source == 'file':
                 console.print(f'    转录进度：{result.duration:.2f}s', end='\r')
@@ -11,6 +11,7 @@ from util.client_rename_audio import rename_audio
 from util.client_strip_punc import strip_punc
 from util.client_write_md import write_md
 from util.client_type_result import type_result
+from util.client_result_builder import ResultBuilder
 
 
 async def recv_result():
@@ -20,18 +21,37 @@ async def recv_result():
         return
     Cosmic.emit_status('connected', None)
     console.print('[green]Connected successfully\n')
+    builder = ResultBuilder()
     try:
+        # Negotiate result format: only the fields we use, partial results or not,
+        # and delta results where each message only carries newly appended tokens
+        await Cosmic.websocket.send(json.dumps({
+            'type': 'subscribe',
+            'fields': list(Config.result_fields),
+            'partial': Config.partial_results,
+            'delta': Config.delta_results,
+        }))
+
         while True:
             # receive message
             message = await Cosmic.websocket.recv()
             message = json.loads(message)
-            text = message['text']
-            delay = message['time_complete'] - message['time_submit']
+
+            # Rebuild full tokens/timestamps from delta messages
+            try:
+                message = builder.feed(message, with_text=False)
+            except ValueError as e:
+                builder.discard(message['task_id'])
+                print(e)
+                continue
 
             # If not final result, continue waiting
             if not message['is_final']:
                 continue
 
+            text = message['text']
+            delay = message['time_complete'] - message['time_submit']
+
             # Remove trailing punctuation
             text = strip_punc(text)
 
@@ -0,0 +1,50 @@
+import re
+from typing import Dict, List
+
+
+def tokens_to_text(tokens: List[str]) -> str:
+    """Join tokens the same way the server does for non-final results."""
+    text = ' '.join(tokens).replace('@@ ', '')
+    return re.sub('([^a-zA-Z0-9]) (?![a-zA-Z0-9])', r'\1', text)
+
+
+class ResultBuilder:
+    """
+    Rebuild full results from delta messages.
+
+    With delta results subscribed, every message only carries the tokens and
+    timestamps appended since the previous message of the same task, plus a
+    sequence number. feed() appends them and returns the message with the full
+    tokens, timestamps and text filled in, like the legacy protocol.
+    """
+
+    def __init__(self) -> None:
+        self._tasks: Dict[str, dict] = {}
+
+    def feed(self, message: dict, with_text: bool = True) -> dict:
+        if 'seq' not in message:
+            return message      # legacy full message
+
+        task_id = message['task_id']
+        state = self._tasks.setdefault(task_id, {'seq': 0, 'tokens': [], 'timestamps': []})
+        if message['seq'] != state['seq'] + 1 or message['start'] != max(len(state['tokens']), len(state['timestamps'])):
+            raise ValueError(f'Result message out of order for task {task_id}: '
+                             f'got seq {message["seq"]}, expected {state["seq"] + 1}')
+        state['seq'] = message['seq']
+        state['tokens'] += message.get('tokens', [])
+        state['timestamps'] += message.get('timestamps', [])
+
+        full = dict(message)
+        full['tokens'] = state['tokens']
+        full['timestamps'] = state['timestamps']
+        if message['is_final']:
+            self._tasks.pop(task_id)
+        elif with_text:
+            full['text'] = tokens_to_text(state['tokens'])
+        return full
+
+    def discard(self, task_id: str) -> None:
+        self._tasks.pop(task_id, None)
+
+    def clear(self) -> None:
+        self._tasks.clear()
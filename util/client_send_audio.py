@@ -30,6 +30,19 @@ async def send_message(message):
             print(e)
 
 
+async def send_data(data: bytes):
+    # Send raw PCM as a binary frame, metadata was sent with the stream_start message
+    if not Cosmic.websocket_is_open():
+        return
+    try:
+        await Cosmic.websocket.send(data)
+    except websockets.ConnectionClosedError:
+        pass
+    except Exception as e:
+        print('Error occurred')
+        print(e)
+
+
 async def send_audio():
     try:
 
@@ -46,6 +59,9 @@ async def send_audio():
         # Save audio file
         file_path, file = '', None
 
+        # Whether the stream_start message has been sent (binary mode)
+        stream_started = False
+
         # Start getting data
         # task: {'type', 'time', 'data'}
         while task := await Cosmic.queue_in.get():
@@ -75,6 +91,26 @@ async def send_audio():
                 if Config.save_audio:
                     write_file(file, data)
 
+                # Audio data: float32, mono, 16000Hz
+                pcm = np.mean(data[::3], axis=1).tobytes()
+
+                # Binary mode: metadata once, then raw PCM frames
+                if Config.binary_audio:
+                    if not stream_started:
+                        stream_started = True
+                        message = {
+                            'type': 'stream_start',
+                            'task_id': task_id,
+                            'seg_duration': Config.mic_seg_duration,
+                            'seg_overlap': Config.mic_seg_overlap,
+                            'is_final': False,
+                            'time_start': time_start,
+                            'source': 'mic',
+                        }
+                        asyncio.create_task(send_message(message))
+                    task = asyncio.create_task(send_data(pcm))
+                    continue
+
                 # Send audio data for recognition
                 message = {
                     'task_id': task_id,             # Task ID
@@ -84,9 +120,7 @@ async def send_audio():
                     'time_start': time_start,       # Recording start time
                     'time_frame': task['time'],     # Frame time
                     'source': 'mic',                # Data source: data from microphone
-                    'data': base64.b64encode(       # Data
-                                np.mean(data[::3], axis=1).tobytes()
-                            ).decode('utf-8'),
+                    'data': base64.b64encode(pcm).decode('utf-8'),  # Data
                 }
                 task = asyncio.create_task(send_message(message))
             elif task['type'] ==  'finish':
@@ -110,5 +144,10 @@ async def send_audio():
                 }
                 task = asyncio.create_task(send_message(message))
                 break
+    except asyncio.CancelledError:
+        # Recording cancelled: ask server to drop buffered audio and queued segments
+        message = {'type': 'cancel', 'task_id': task_id, 'is_final': False}
+        asyncio.create_task(send_message(message))
+        raise
     except Exception as e:
         print(e)
@@ -0,0 +1,111 @@
+import re
+from functools import lru_cache
+
+from pypinyin import pinyin
+from pypinyin.constants import PHRASES_DICT, RE_HANS
+from pypinyin.seg import mmseg
+
+'''
+客户端共用的拼音查询，结果与 pypinyin.pinyin(文本, 风格, 多音字) 一致，只是快得多。
+
+pypinyin 每次调用都要重新分词、查字典、转换拼音风格，
+而识别结果和热词里反复出现的总是那几千个常用字和常用词：
+
+    字音表：每个字在某种风格、是否多音字下的读音元组，第一次查到时算好存下，之后直接取
+    词音：  分词得到的词语的读音，带 LRU 缓存
+    段音：  一段连续汉字（两个标点之间）的读音，同样带 LRU 缓存，口头常说的短句不必再分词
+    分词：  与 pypinyin 相同的正向最大匹配，但按下标前进，不反复切片剩余文本
+
+使用方法示例：
+
+    拼音('撒贝宁ok', 0, True)
+    # [('sa',), ('bei',), ('ning', 'zhu'), ('ok',)]
+'''
+
+
+__all__ = ['字音', '词音', '段音', '分段', '分词', '拼音']
+
+
+字音表 = {}      # (风格, 多音字) -> {字: 读音元组}
+
+_前缀集 = getattr(mmseg.p_set, '_set', mmseg.p_set)     # 词库中所有词语的前缀
+_汉字段 = re.compile(f'({RE_HANS.pattern[1:-1]})')        # 去掉首尾的 ^ $，用于切分汉字与非汉字
+
+
+def 字音(字: str, 风格=0, 多音字=True) -> tuple:
+    '''
+    单个字的读音元组，多音字在前的是常用读音
+    每种风格一张表，字第一次出现时调用 pypinyin 算出读音并记下
+    '''
+    表 = 字音表.get((风格, 多音字))
+    if 表 is None:
+        表 = 字音表[(风格, 多音字)] = {}
+    读音 = 表.get(字)
+    if 读音 is None:
+        结果 = pinyin(字, 风格, 多音字)
+        读音 = 表[字] = tuple(结果[0]) if 结果 else (字,)
+    return 读音
+
+
+@lru_cache(maxsize=8192)
+def 词音(词: str, 风格=0, 多音字=True) -> tuple:
+    '''分词得到的一个词语的读音，每个字一个读音元组，词库中的词语按词语的读音'''
+    if len(词) == 1:
+        return (字音(词, 风格, 多音字),)
+    return tuple(tuple(x) for x in pinyin(词, 风格, 多音字))
+
+
+def 分段(文本: str):
+    '''把文本切成连续的汉字和连续的非汉字，逐段产出 (段, 是否汉字)，与 pypinyin 的 simple_seg 相同'''
+    for 序号, 段 in enumerate(_汉字段.split(文本)):
+        if 段:
+            yield 段, 序号 % 2 == 1
+
+
+def 分词(汉字串: str):
+    '''
+    对连续的汉字做正向最大匹配分词，逐个产出词语或单字，与 pypinyin 的 mmseg 分词结果相同：
+    从当前位置尽量向后延伸，直到不再是词库中某个词的前缀，取其中最长的词语，没有就取一个字
+    '''
+    起, 总数 = 0, len(汉字串)
+    while 起 < 总数:
+        止, 最长 = 起 + 1, 0
+        while 止 <= 总数 and 汉字串[起:止] in _前缀集:
+            if 汉字串[起:止] in PHRASES_DICT:
+                最长 = 止
+            止 += 1
+        if 止 > 总数 and not 最长:
+            # 剩下的整段都是某个词的前缀，却没有一个完整的词语，pypinyin 在这里把剩下的字逐个拆开
+            yield from 汉字串[起:]
+            return
+        止 = 最长 or 起 + 1
+        yield 汉字串[起:止]
+        起 = 止
+
+
+@lru_cache(maxsize=4096)
+def 段音(汉字串: str, 风格=0, 多音字=True) -> tuple:
+    '''一段连续汉字的读音，每个字一个读音元组'''
+    结果 = []
+    for 词 in 分词(汉字串):
+        if len(词) == 1:
+            结果.append(字音(词, 风格, 多音字))
+        else:
+            结果.extend(词音(词, 风格, 多音字))
+    return tuple(结果)
+
+
+def 拼音(文本: str, 风格=0, 多音字=True) -> list:
+    '''
+    文本的拼音列表，每项是一个读音元组：汉字一字一项，连续的非汉字原样作为一项
+
+    例如，输入 '乐清ok' ，输出：
+        [('yue',), ('qing',), ('ok',)]
+    '''
+    结果 = []
+    for 段, 汉字 in 分段(文本):
+        if 汉字:
+            结果.extend(段音(段, 风格, 多音字))
+        else:
+            结果.append((段,))
+    return 结果
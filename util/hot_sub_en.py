@@ -25,6 +25,9 @@ print(res)
 __all__ = ['更新热词词典', '热词替换']
 
 热词词典 = {}       
+热词字典树 = {}     # 规范化热词逐字建成的字典树，结点是 {字符: 子结点}，热词本身存在结点的 '' 键下
+
+_字母 = frozenset('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ_')    # 热词前后不能紧挨着的字符
 
 
 def 更新热词词典(热词文本: str):
@@ -32,28 +35,81 @@ def 更新热词词典(热词文本: str):
     把热词文本中的每一行去除多余空格后添加到热词词典，
     key 是热词，
     value 是热词的小写
+
+    同时把所有热词的小写、去掉符号的形式编进一棵字典树，
+    替换时只需沿句子扫描一遍，与热词的数量无关
     '''
-    global 热词词典; 热词词典.clear()
+    global 热词词典, 热词字典树; 热词词典.clear(); 热词字典树 = {}
     for 热词 in 热词文本.splitlines():
         热词 = 热词.strip()
         if not 热词 or 热词.startswith('#'): continue
         热词词典[热词] = re.sub('[^\w]', '', 热词.lower())
+    for 热词, 规范 in 热词词典.items():
+        if not 规范: continue
+        结点 = 热词字典树
+        for 字 in 规范:
+            结点 = 结点.setdefault(字, {})
+        结点[''] = 热词     # 规范形式相同的热词，靠后的为准
     return len(热词词典)
 
 
+def 规范化(句子: str):
+    '''
+    把句子转为小写并去掉空格，返回 (规范化的句子, 位置表)，
+    位置表的第 i 项是规范化句子第 i 个字符在原句中的下标
+    '''
+    小写 = 句子.lower()
+    if len(小写) == len(句子):
+        return 小写.replace(' ', ''), [i for i, 字 in enumerate(句子) if 字 != ' ']
+    规范, 位置 = [], []     # 极少数字符转小写后长度会变
+    for i, 字 in enumerate(句子):
+        if 字 == ' ': continue
+        for 小写字 in 字.lower():
+            规范.append(小写字)
+            位置.append(i)
+    return ''.join(规范), 位置
+
+
+def 查找热词(句子: str):
+    '''
+    扫描一遍句子，返回所有匹配 (起, 止, 热词)，起止是原句中的下标，左闭右开
+
+    热词的字母之间可以夹着空格，不区分大小写；热词前后不能紧挨着英文字母或下划线。
+    从左到右，每个位置沿字典树走到底，取满足前后条件的最长热词，匹配之间不重叠
+    '''
+    if not 热词字典树: return []
+    规范, 位置 = 规范化(句子)
+    匹配 = []
+    i, 总数 = 0, len(规范)
+    while i < 总数:
+        结点 = 热词字典树.get(规范[i])
+        if 结点 is None or (位置[i] and 句子[位置[i] - 1] in _字母):
+            i += 1
+            continue
+        最长 = None
+        j = i
+        while 结点 is not None:
+            j += 1
+            if '' in 结点:
+                止 = 位置[j - 1] + 1
+                if 止 == len(句子) or 句子[止] not in _字母:
+                    最长 = (j, 止, 结点[''])
+            结点 = 结点.get(规范[j]) if j < 总数 else None
+        if 最长 is None:
+            i += 1
+            continue
+        j, 止, 热词 = 最长
+        匹配.append((位置[i], 止, 热词))
+        i = j
+    return 匹配
+
+
 def 匹配热词(句子:str):
     '''
-    将全局「热词词典」中的热词按照小写依次与句子匹配，将所有匹配到的热词放到列表
+    将句子与全局「热词词典」中的热词匹配，将所有匹配到的热词放到列表
     '''
-    global 热词词典
+    return [热词 for _, _, 热词 in 查找热词(句子)]
 
-    所有匹配 = []
-    小写无空格句子 = 句子.lower().replace(' ', '')
-    for 词 in 热词词典:
-        if 热词词典[词] in 小写无空格句子:
-            所有匹配.append(词)
-    
-    return 所有匹配
 
 def 热词替换(句子):
     '''
@@ -61,14 +117,14 @@ def 热词替换(句子):
 
     句子：       被查找和替换的句子
     '''
-    所有匹配 = 匹配热词(句子)
-    for 匹配项 in 所有匹配:
-        正则模式 = re.sub('[^\w]', '', 匹配项)
-        正则模式1 = r'(?<=[^a-zA-z])' + re.sub('(.)', r'\1 *?', 正则模式) + r'(?=[^a-zA-z]|\b)'
-        正则模式2 = r'(?<=\b)' + re.sub('(.)', r'\1 *?', 正则模式) + r'(?=[^a-zA-z]|\b)'
-        句子 = re.sub(正则模式1, 匹配项, 句子, flags=re.I)
-        句子 = re.sub(正则模式2, 匹配项, 句子, flags=re.I)
-    return 句子
+    结果 = []
+    位置 = 0
+    for 起, 止, 热词 in 查找热词(句子):
+        结果.append(句子[位置:起])
+        结果.append(热词)
+        位置 = 止
+    结果.append(句子[位置:])
+    return ''.join(结果)
 
 if __name__ == '__main__':
     print(f'\x9b42m-------------开始---------------\x9b0m')
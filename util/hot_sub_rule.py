@@ -1,5 +1,10 @@
 import re
 
+try:
+    from re import _parser as sre_parse
+except ImportError:           # Python 3.10 及以前
+    import sre_parse
+
 
 
 '''
@@ -29,6 +34,99 @@ import re
 __all__ = ['更新热词词典', '热词替换']
 
 模式词典 = {}       
+规则列表 = []       # [(模式, 编译好的正则, 替换式)]，与模式词典的顺序相同
+必查规则 = []       # 提取不出必需字面量的规则序号，每句都要检查
+字面量筛选 = None   # 字面量自动机，找出句子中出现了必需字面量的规则
+
+
+class 字面量自动机:
+    '''
+    多个字面量的 Aho-Corasick 自动机，每个字面量关联一条规则的序号
+    扫描一遍句子，得到句子中出现了其字面量的所有规则，与字面量的数量无关
+    '''
+
+    def __init__(self, 字面量: dict):
+        '''字面量：{字面量: [规则序号]}'''
+        self.转移 = [{}]
+        self.输出 = [set()]
+        for 词, 序号列表 in 字面量.items():
+            状态 = 0
+            for 字 in 词:
+                下一个 = self.转移[状态].get(字)
+                if 下一个 is None:
+                    下一个 = self.转移[状态][字] = len(self.转移)
+                    self.转移.append({})
+                    self.输出.append(set())
+                状态 = 下一个
+            self.输出[状态].update(序号列表)
+
+        # 按层建立失败指针，并把失败指针所指状态的输出并入自己
+        self.失败 = [0] * len(self.转移)
+        队列 = list(self.转移[0].values())
+        for 状态 in 队列:
+            for 字, 下一个 in self.转移[状态].items():
+                回退 = self.失败[状态]
+                while 回退 and 字 not in self.转移[回退]:
+                    回退 = self.失败[回退]
+                self.失败[下一个] = self.转移[回退].get(字, 0)
+                self.输出[下一个] |= self.输出[self.失败[下一个]]
+                队列.append(下一个)
+
+    def 查找(self, 句子: str) -> set:
+        转移, 失败, 输出 = self.转移, self.失败, self.输出
+        结果 = set()
+        状态 = 0
+        for 字 in 句子:
+            while 状态 and 字 not in 转移[状态]:
+                状态 = 失败[状态]
+            状态 = 转移[状态].get(字, 0)
+            if 输出[状态]:
+                结果 |= 输出[状态]
+        return 结果
+
+
+def _必需字面量(序列):
+    '''
+    正则解析树中的一个序列，凡是能匹配就必然包含的字面量，返回一组（匹配时至少出现其中一个），取不到时返回 None
+    序列有多个必需的部分时，取最短的字面量最长的那一组，筛选效果最好
+    '''
+    候选 = []
+    连续 = ''
+    for 操作, 参数 in 序列:
+        if 操作 == sre_parse.LITERAL:
+            连续 += chr(参数)
+            continue
+        if 连续:
+            候选.append({连续})
+            连续 = ''
+        if 操作 == sre_parse.SUBPATTERN:
+            _, 加标志, 减标志, 子序列 = 参数
+            组 = None if 加标志 or 减标志 else _必需字面量(子序列)
+        elif 操作 == sre_parse.BRANCH:
+            分支 = [_必需字面量(子序列) for 子序列 in 参数[1]]
+            组 = None if None in 分支 else set().union(*分支)
+        elif 操作 in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and 参数[0] >= 1:
+            组 = _必需字面量(参数[2])
+        else:
+            组 = None
+        if 组:
+            候选.append(组)
+    if 连续:
+        候选.append({连续})
+    if not 候选:
+        return None
+    return max(候选, key=lambda 组: (min(map(len, 组)), -len(组)))
+
+
+def 必需字面量(模式: str):
+    '''模式能匹配的句子中必然出现的一组字面量（至少出现其一），忽略大小写的模式或解析失败时返回 None'''
+    try:
+        解析 = sre_parse.parse(模式)
+        if 解析.state.flags & re.IGNORECASE:
+            return None
+        return _必需字面量(解析)
+    except Exception:
+        return None
 
 
 def 更新热词词典(热词文本: str):
@@ -36,8 +134,12 @@ def 更新热词词典(热词文本: str):
     把热词规则文本中的每一行用 = 分开，去除多余空格后添加到热词词典，
     key     是被替换的词，
     value   是将被替换成的词
+
+    载入时把所有规则编译好，并提取每条规则必需的字面量建成自动机，
+    替换时只检查句子中出现了字面量的规则
     '''
-    global 模式词典; 模式词典.clear()
+    global 模式词典, 规则列表, 必查规则, 字面量筛选
+    模式词典.clear(); 规则列表 = []; 必查规则 = []
     for 热词 in 热词文本.splitlines():
         if not 热词 or 热词.startswith('#'): continue
         key_value = 热词.split(' = ')
@@ -45,31 +147,50 @@ def 更新热词词典(热词文本: str):
             key = key_value[0].strip()
             value = key_value[1].strip()
             模式词典[key] = value
+
+    字面量 = {}
+    for 模式, 替换式 in list(模式词典.items()):
+        try:
+            正则 = re.compile(模式)
+        except re.error as e:
+            print(f'\x9b31m    规则「{模式}」不是有效的正则表达式，抛弃：{e}\x9b0m')
+            del 模式词典[模式]
+            continue
+        序号 = len(规则列表)
+        规则列表.append((模式, 正则, 替换式))
+        组 = 必需字面量(模式)
+        if not 组:
+            必查规则.append(序号)
+            continue
+        for 词 in 组:
+            字面量.setdefault(词, []).append(序号)
+    字面量筛选 = 字面量自动机(字面量)
     return len(模式词典)
 
 
+def 匹配规则(句子: str):
+    '''按规则的顺序，返回能在句子中匹配到的规则 [(模式, 编译好的正则, 替换式)]'''
+    if not 规则列表: return []
+    候选 = 字面量筛选.查找(句子).union(必查规则)
+    return [规则列表[序号] for 序号 in sorted(候选) if 规则列表[序号][1].search(句子)]
+
+
 def 匹配热词(句子:str):
     '''
     将全局「热词词典」中的热词按照 key 依次与句子匹配，将所有匹配到的热词放到列表
     '''
-    global 模式词典
-
-    所有匹配 = []
-    for 模式 in 模式词典:
-        if re.findall(模式, 句子):
-            所有匹配.append(模式)
-    
-    return 所有匹配
+    return [模式 for 模式, _, _ in 匹配规则(句子)]
 
 def 热词替换(句子:str):
     '''
     从热词词典中查找匹配的热词，替换句子
 
     句子：       被查找和替换的句子
+
+    先用原句找出所有能匹配的规则，再按顺序依次替换
     '''
-    所有匹配模式 = 匹配热词(句子)
-    for 模式 in 所有匹配模式:
-        句子 = re.sub(模式, 模式词典[模式], 句子)
+    for _, 正则, 替换式 in 匹配规则(句子):
+        句子 = 正则.sub(替换式, 句子)
     return 句子
 
 if __name__ == '__main__':
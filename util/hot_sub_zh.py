@@ -1,6 +1,13 @@
-from pypinyin import pinyin
+import sys
+from pathlib import Path
 from time import time
 
+if __name__ == '__main__' and not __package__:
+    # 以 python util/hot_sub_zh.py 直接运行时，搜索路径里只有 util 目录，把项目根目录加进去
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from util import hot_pinyin
+
 '''
 热词是每行一个的文本，先更新热词词典，然后再替换句子中的热词。
 使用方法示例：
@@ -31,6 +38,7 @@ __all__ = ['更新热词词典', '热词替换', '多音字', '声调']
 
 
 热词词典 = {}
+热词索引 = {}    # 热词开头一两个音节 -> [(热词, 拼音格, 序号)]
 多音字 = True
 声调 = False     # 是否要求匹配声调
 
@@ -47,63 +55,87 @@ def 更新热词词典(热词文本: str):
 
     heteronym: 是否启用多音字
 
+    词典中每个热词对应一个拼音格：每个字一组可以接受的读音，
+    多音字的各种读音组合不再逐一展开，五个多音字也只占五组。
     如果启用了多音字，返回的词典是这样的形式：
-        {'撒贝宁': [
-                    ['sā', 'bèi', 'níng'],
-                    ['sǎ', 'bèi', 'níng'],
-                    ['sā', 'bèi', 'nìng'],
-                    ['sǎ', 'bèi', 'nìng'],
-                    ['sā', 'bèi', 'zhù'],
-                    ['sǎ', 'bèi', 'zhù']
-                ]
-        }
+        {'撒贝宁': (('sā', 'sǎ'), ('bèi',), ('níng', 'nìng', 'zhù'))}
     
     如果没有启用多音字，返回的词典是这样的形式：
-        {'撒贝宁': [
-                    ['sā', 'bèi', 'níng'], 
-                ]
-        }
+        {'撒贝宁': (('sā',), ('bèi',), ('níng',))}
+
+    同时按热词开头的一两个音节建立索引，替换时句子每个位置只需检查极少数候选热词
     '''
-    global 热词词典; 热词词典.clear()
+    global 热词词典, 热词索引; 热词词典.clear(); 热词索引 = {}
+    读音组 = {}     # 相同的读音组共用一个元组
     for 热词 in 热词文本.splitlines():
         热词 = 热词.strip()                             # 给热词去掉多余的空格
         if not 热词 or 热词.startswith('#'): continue   # 过滤掉注释
-        热词拼音 = pinyin(热词, 风格, 多音字)     # 得到拼音
+        热词拼音 = hot_pinyin.拼音(热词, 风格, 多音字)     # 得到拼音
 
         if len(热词拼音) != len(热词): 
             print(f'\x9b31m    热词「{热词}」得到的拼音数量与字数不符，抛弃\x9b0m')
             continue
 
-        拼音列表 = [[], ]
-        for 多音 in 热词拼音: 
-            音数 = len(多音)
-            if 音数 > 1:
-                原始列表, 拼音列表 = 拼音列表, []
-                for 音 in 多音:
-                    拼音列表.extend([x.copy() + [音] for x in 原始列表])
-            else:
-                for x in 拼音列表: x.append(多音[0])
-        
-        热词词典[热词] = 拼音列表
+        拼音格 = tuple(读音组.setdefault(tuple(多音), tuple(多音)) for 多音 in 热词拼音)
+        热词词典[热词] = 拼音格
+
+    for 序号, (热词, 拼音格) in enumerate(热词词典.items()):
+        if len(拼音格) == 1:
+            键列表 = [(音,) for 音 in 拼音格[0]]
+        else:
+            键列表 = [(音1, 音2) for 音1 in 拼音格[0] for 音2 in 拼音格[1]]
+        for 键 in 键列表:
+            热词索引.setdefault(键, []).append((热词, 拼音格, 序号))
     return len(热词词典)
 
 
+def 查找热词(音节列表):
+    '''
+    扫描一遍句子的音节列表，返回所有匹配 (起, 止, 热词, 热词序号)，起止是音节下标，左闭右开
+    每个位置用当前的一两个音节在索引中取出候选热词，再逐个位置检查音节是否在拼音格里
+    '''
+    匹配 = []
+    总数 = len(音节列表)
+    for i, 音 in enumerate(音节列表):
+        候选 = 热词索引.get((音,), ())
+        if i + 1 < 总数 and (双音 := 热词索引.get((音, 音节列表[i + 1]))):
+            候选 = (*候选, *双音)
+        for 热词, 拼音格, 序号 in 候选:
+            止 = i + len(拼音格)
+            if 止 > 总数: continue
+            if all(音节列表[i + k] in 拼音格[k] for k in range(2, len(拼音格))):
+                匹配.append((i, 止, 热词, 序号))
+    return 匹配
+
+
+def 拼音区间(句子: str):
+    '''
+    句子的拼音序列，每项是 (拼音, 起, 止)，起止是这个拼音在句子中对应的字符区间
+    汉字一字一个拼音；连续的非汉字（英文、数字、标点）原样作为一项
+
+    例如，输入 '撒贝宁ok' ，输出：
+        [('sa', 0, 1), ('bei', 1, 2), ('ning', 2, 3), ('ok', 3, 5)]
+    '''
+    区间 = []
+    位置 = 0
+    for 段, 汉字 in hot_pinyin.分段(句子):
+        if 汉字:
+            读音列表 = hot_pinyin.段音(段, 风格, 多音字)
+            区间.extend((读音[0], 位置 + k, 位置 + k + 1) for k, 读音 in enumerate(读音列表))
+        else:
+            区间.append((段, 位置, 位置 + len(段)))
+        位置 += len(段)
+    return 区间
+
+
 def 匹配热词(句子:str):
     '''
-    将全局「热词词典」中的热词按照拼音依次与句子匹配，将所有匹配到的「热词、拼音」以元组放到列表
+    将句子的拼音扫描一遍，将所有匹配到的「热词、拼音」以元组放到列表
     将列表返回
     '''
-    global 热词词典
-
-    所有匹配 = []
-    句子拼音 = ''.join([x[0] for x in pinyin(句子, 风格, 多音字)])  # 字符串形式的句子拼音
-    for 词 in 热词词典.keys():
-        for 拼音序列 in 热词词典[词]:
-            if ''.join(拼音序列) in 句子拼音: 
-                所有匹配.append((词, 拼音序列))
-            else: 
-                continue
-    return 所有匹配
+    if not 热词索引: return []
+    音节列表 = [x[0] for x in 拼音区间(句子)]
+    return [(热词, 音节列表[起:止]) for 起, 止, 热词, _ in 查找热词(音节列表)]
 
 
 def 获取拼音索引(句子: str):
@@ -117,15 +149,7 @@ def 获取拼音索引(句子: str):
         {'pinyin': 'nìng', 'index': 2 }, 
     ]
     '''
-    拼音带索引 = [{'pinyin': x[0], 'index': None} for x in pinyin(句子, 风格, 多音字)]
-    拼音带索引_ = iter(拼音带索引)
-    拼音 = next(拼音带索引_)
-    for i, 字 in enumerate(句子):
-        if 拼音['pinyin'] in pinyin(字, 风格, 多音字)[0] or 拼音['pinyin'].startswith(字):
-            拼音['index'] = i
-            try: 拼音 = next(拼音带索引_)
-            except: ...
-    return 拼音带索引
+    return [{'pinyin': 拼音, 'index': 起} for 拼音, 起, _ in 拼音区间(句子)]
 
 
 def 热词替换(句子):
@@ -133,27 +157,35 @@ def 热词替换(句子):
     从热词词典中查找匹配的热词，替换句子
 
     句子：       被查找和替换的句子
+
+    扫描一遍得到所有匹配，按热词在文件中的顺序把热词的字写到对应的音节上，
+    互相重叠的匹配，靠后的热词覆盖靠前的，与逐个热词依次替换的结果一致
     '''
-    所有匹配 = 匹配热词(句子)
-    for 匹配项 in 所有匹配:
-        热词, 拼音序列 = 匹配项  # 从字典中找到可以替换的热词和对应的拼音
-        
-        句子索引表 = 获取拼音索引(句子)
-        替换区间 = []
-        for i, item in enumerate(句子索引表):
-            for j, 音 in enumerate(拼音序列):
-                if i+j >= len(句子索引表): break
-                if 音 != 句子索引表[i+j]['pinyin']: break
-            else:
-                替换区间.append([句子索引表[i]['index'], 句子索引表[i+j]['index']])
+    if not 热词索引: return 句子
+    区间 = 拼音区间(句子)
+    匹配 = 查找热词([x[0] for x in 区间])
+    if not 匹配: return 句子
+
+    替换 = {}
+    for 起, 止, 热词, _ in sorted(匹配, key=lambda m: m[3]):
+        for k in range(起, 止):
+            替换[k] = 热词[k - 起]
+    结果 = [替换.get(i, 句子[起:止]) for i, (_, 起, 止) in enumerate(区间)]
+    结果.append(句子[区间[-1][2]:])
+    return ''.join(结果)
 
-        for 区间 in 替换区间:
-            句子 = 句子[:区间[0]] + 热词 + 句子[区间[1]+1:]
 
-    return 句子
+def _内存占用():
+    '''当前进程的常驻内存（MB），只在 Linux 上可用'''
+    try:
+        with open('/proc/self/status') as f:
+            return next(int(行.split()[1]) for 行 in f if 行.startswith('VmRSS')) / 1024
+    except (OSError, StopIteration):
+        return 0
 
 
 if __name__ == '__main__':
+    import tracemalloc
     print(f'\x9b42m-------------开始---------------\x9b0m')
 
     热词文本 = '''
@@ -170,3 +202,17 @@ if __name__ == '__main__':
     t4 = time()
 
     print(f'{res=}    {t4-t3=}')
+
+    # 大热词文件的载入耗时和内存：python util/hot_sub_zh.py hotwords/hot-zh.txt（或 python -m util.hot_sub_zh）
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], encoding='utf-8') as f:
+            热词文本 = f.read()
+        常驻 = _内存占用()
+        tracemalloc.start()
+        t1 = time()
+        数量 = 更新热词词典(热词文本)
+        t2 = time()
+        分配, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f'载入 {数量} 条热词：{t2 - t1:.2f}s，热词数据 {分配 / 2**20:.1f}MB，'
+              f'常驻内存增加 {_内存占用() - 常驻:.1f}MB')